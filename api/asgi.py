@@ -0,0 +1,127 @@
+"""
+Async serving mode: the routes and templates of api/index.py on Quart, with
+asyncpg for the request-path queries and httpx for the scraper, so the
+independent loads of a request run concurrently.
+
+    pip install -r requirements-async.txt
+    hypercorn asgi:api.asgi:app
+"""
+import asyncio
+
+from quart import Quart, Response, jsonify, render_template, request
+
+from api.index import (
+    history_body,
+    history_context,
+    history_validator,
+    index_context,
+    index_validators,
+    instance_stats,
+    is_authorized,
+    selected_series,
+    stats_body,
+    subscribe_from_form,
+    visitor_ip,
+)
+from api.utils.adb import close_pool
+from api.utils.bulletin import page_fragment
+from api.utils.db import begin_request_scope, end_request_scope
+from api.utils.history_cache import get_history_dataset_async, get_history_payload_async
+from api.utils.hits import update_hit_counts_async
+from api.utils.page import load_index_page_async
+from api.utils.refresh import refresh_bulletin_async
+from api.utils.responses import NO_STORE, json_response, not_modified, page_response
+from api.utils.subscription import get_subscriber_count_async, unsubscribe_email
+
+app = Quart(__name__)
+
+@app.after_serving
+async def shutdown():
+    await close_pool()
+
+def _in_db_scope(fn, *args):
+    """Run a sync helper the way the Flask app would: one pooled connection
+    and one transaction. Used for the write paths, in a worker thread."""
+    begin_request_scope()
+    error = None
+    try:
+        return fn(*args)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_request_scope(error)
+
+async def cached_page(etag, render, last_modified=None):
+    """responses.cached_page() with an async render()."""
+    fresh = etag is not None and not_modified([etag], last_modified, req=request)
+    body = None if fresh else await render()
+    return page_response(etag, body, last_modified, response_class=Response)
+
+@app.route("/", methods=["GET", "POST"])
+async def check_bulletin():
+    category, country = selected_series(request.args)
+
+    # Bulletin copy and latest history in parallel when not in memory
+    page = await load_index_page_async(category=category, country=country)
+    cache = page.cache
+
+    etag = last_modified = None
+    if cache and cache["snapshot"]:
+        bulletin = cache
+        etag, last_modified = index_validators(cache, category, country)
+    else:
+        bulletin = await refresh_bulletin_async()
+
+    subs_msg = ""
+    if request.method == "POST":
+        form = await request.form
+        subs_msg = await asyncio.to_thread(_in_db_scope, subscribe_from_form, form, bulletin)
+
+    async def render():
+        return await render_template(
+            "index.html", **index_context(page_fragment(bulletin), subs_msg, page.latest_history, category, country)
+        )
+
+    if request.method == "POST":
+        resp = Response(await render(), mimetype="text/html")
+        resp.headers["Cache-Control"] = NO_STORE
+        return resp
+    return await cached_page(etag, render, last_modified=last_modified)
+
+@app.route("/api/stats", methods=["GET", "POST"])
+async def stats():
+    ip = visitor_ip(request) if request.method == "POST" else None
+    hits, subscribers = await asyncio.gather(update_hit_counts_async(ip=ip), get_subscriber_count_async())
+    resp = jsonify(stats_body(hits, subscribers))
+    resp.headers["Cache-Control"] = NO_STORE
+    return resp
+
+@app.route("/api/instance_stats", methods=["GET"])
+async def instance_stats_route():
+    if not is_authorized(request):
+        return {"statusCode": 401, "body": "Unauthorized"}, 401
+    resp = jsonify({"statusCode": 200, "body": instance_stats()})
+    resp.headers["Cache-Control"] = NO_STORE
+    return resp
+
+@app.route("/unsubscribe", methods=["GET"])
+async def unsubscribe():
+    email = request.args.get("email", "")
+    if email and await asyncio.to_thread(_in_db_scope, unsubscribe_email, email):
+        return await render_template("unsubscribe.html", message=f"✅ {email} has been unsubscribed.")
+    return await render_template("unsubscribe.html", message="❌ Email not found or already unsubscribed.")
+
+@app.route("/history")
+async def history():
+    category, country = selected_series(request.args)
+    payload = await get_history_payload_async(category=category, country=country)
+    etag = history_validator(category, country)
+    return await cached_page(
+        etag, lambda: render_template("history.html", **history_context(payload, category, country))
+    )
+
+@app.route("/api/history")
+async def history_api():
+    version, dataset = await get_history_dataset_async()
+    return json_response(history_body(dataset), req=request, response_class=Response, cacheable=version is not None)
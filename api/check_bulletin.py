@@ -1,73 +1,130 @@
 import os
 from flask import Flask, request
-from api.utils.bulletin import run_check
-from api.utils.db import get_cached_bulletin, save_cached_bulletin, save_bulletin_history
-from api.utils.subscription import load_subscriptions, save_subscriptions
-from api.utils.email import send_email
+from api.utils.bulletin import email_fragment, run_check
+from api.utils.db import get_cached_bulletin, record_bulletin_revision, save_cached_bulletin, save_bulletin_history
+from api.utils.detector import detect_bulletin_change, detector_stats, record_full_run
+from api.utils.hits import sweep_visitor_filters
+from api.utils.http_cache import fetch_stats
+from api.utils.jobs import create_job, get_job, next_unfinished_job, run_job
 
 CRON_SECRET = os.getenv("CRON_SECRET")
 
 app = Flask(__name__)
 
+def is_authorized():
+    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+    return bool(CRON_SECRET) and token == CRON_SECRET
+
 @app.route("/api/check_bulletin", methods=["GET"])
 def check_bulletin():
-    token = request.headers.get("Authorization", "").replace("Bearer ", "")
-    if not CRON_SECRET or token != CRON_SECRET:
+    if not is_authorized():
         return {"statusCode": 401, "body": "Unauthorized"}, 401
     # Check what's currently cached
     cache = get_cached_bulletin()
     cached_month = cache["bulletin_month"] if cache else None
 
+    # Cheap look at the index page first; most calls end here
+    detection = detect_bulletin_change(cached_month, force=request.args.get("force") == "1")
+    if not detection.run:
+        return {
+            "statusCode": 200,
+            "body": {
+                "bulletin_month": cached_month,
+                "status": "skipped",
+                "reason": detection.reason,
+                "poll_interval": detection.interval,
+                "detector": detector_stats(),
+                "fetch": fetch_stats(),
+            }
+        }
+
     # Scrape fresh
-    result, bulletin_month, records, bulletin_url = run_check(return_month=True, return_eb2=True)
+    snapshot = run_check()
+    bulletin_month = snapshot.bulletin_month
     if not bulletin_month:
-        return {"statusCode": 200, "body": {"error": "Failed to fetch bulletin"}}
+        return {"statusCode": 200, "body": {"error": "Failed to fetch bulletin", "fetch": fetch_stats()}}
+    record_full_run(detection, snapshot.link)
 
-    # Update cache
-    save_cached_bulletin(result, bulletin_month)
+    # Same bulletin, same tables: nothing to write
+    if cached_month == bulletin_month and cache["snapshot"] and cache["content_hash"] == snapshot.table_hash:
+        return {
+            "statusCode": 200,
+            "body": {
+                "bulletin_month": bulletin_month,
+                "status": "no change",
+                "reason": detection.reason,
+                "fetch": fetch_stats(),
+            }
+        }
 
-    # Save employment history for all categories/countries
-    if records is not None and bulletin_month:
+    # Update cache (a no-op if another writer already stored these tables)
+    save_cached_bulletin(snapshot.stored(), bulletin_month, snapshot.table_hash)
+    revision = record_bulletin_revision(snapshot)
+
+    # Save employment history for all categories/countries; only changed rows are written
+    history_changed = 0
+    if snapshot.records is not None:
         try:
-            from datetime import datetime as dt
-            parts = bulletin_month.split("-")
-            bm_date = dt.strptime(f"{parts[1]} {parts[0]}", "%B %Y").date()
-            save_bulletin_history(bm_date, records, bulletin_url)
+            history_changed = save_bulletin_history(snapshot.month_date, snapshot.records, snapshot.link)
         except Exception:
             pass
 
-    # Only send emails if the bulletin month has changed from the cache
+    # Only send emails if the bulletin month has changed from the cache;
+    # a corrected bulletin is recorded as a revision without emailing
     if cached_month == bulletin_month:
         return {
             "statusCode": 200,
             "body": {
                 "bulletin_month": bulletin_month,
-                "status": "no change",
+                "status": "revised" if revision and revision > 1 else "no change",
+                "reason": detection.reason,
+                "revision": revision,
+                "history_rows_changed": history_changed,
+                "fetch": fetch_stats(),
             }
         }
 
-    # New bulletin detected — notify subscribers
-    subscriptions = load_subscriptions()
-    sent = 0
-    failed = 0
-    for subscription in subscriptions:
-        email = subscription["email"]
-        last_sent_month = subscription["last_sent_month"]
-
-        if last_sent_month != bulletin_month:
-            subject = f"Visa Bulletin for {bulletin_month}"
-            if not send_email(email, subject, result, bulletin_month):
-                failed += 1
-            else:
-                save_subscriptions({"emails": [email], "last_sent_month": bulletin_month})
-                sent += 1
+    # New bulletin detected — start a resumable notification job and send
+    # its first chunks; /api/notification_jobs/continue picks up the rest
+    subject = f"Visa Bulletin for {bulletin_month}"
+    job_id = create_job(bulletin_month, subject, email_fragment(snapshot.cache_entry()))
+    job = run_job(job_id)
 
     return {
         "statusCode": 200,
         "body": {
             "bulletin_month": bulletin_month,
             "status": "new bulletin",
-            "emails_sent": sent,
-            "emails_failed": failed,
+            "emails_sent": job["sent"],
+            "emails_failed": job["failed"],
+            "job": job,
+            "fetch": fetch_stats(),
         }
     }
+
+@app.route("/api/notification_jobs/continue", methods=["GET", "POST"])
+def continue_notification_job():
+    if not is_authorized():
+        return {"statusCode": 401, "body": "Unauthorized"}, 401
+    job_id = request.args.get("job_id", type=int) or next_unfinished_job()
+    if job_id is None:
+        return {"statusCode": 200, "body": {"status": "idle"}}
+    job = run_job(job_id)
+    if job is None:
+        return {"statusCode": 404, "body": "Job not found"}, 404
+    return {"statusCode": 200, "body": {"status": job["status"], "job": job}}
+
+@app.route("/api/notification_jobs/<int:job_id>", methods=["GET"])
+def notification_job_status(job_id):
+    if not is_authorized():
+        return {"statusCode": 401, "body": "Unauthorized"}, 401
+    job = get_job(job_id)
+    if job is None:
+        return {"statusCode": 404, "body": "Job not found"}, 404
+    return {"statusCode": 200, "body": {"status": job["status"], "job": job}}
+
+@app.route("/api/sweep_visitors", methods=["GET", "POST"])
+def sweep_visitors():
+    if not is_authorized():
+        return {"statusCode": 401, "body": "Unauthorized"}, 401
+    return {"statusCode": 200, "body": {"deleted_buckets": sweep_visitor_filters()}}
@@ -1,12 +1,25 @@
 import json
-from flask import Flask, request, render_template
-from datetime import datetime
+import os
+from flask import Flask, jsonify, make_response, request, render_template
+from datetime import datetime, timezone
 
-from api.utils.bulletin import run_check
-from api.utils.db import get_cached_bulletin, save_cached_bulletin, get_bulletin_history, get_latest_history
-from api.utils.hits import update_hit_counts
+from api.utils.bulletin import email_fragment, page_fragment
+from api.utils.db import begin_request_scope, bulletin_cache_stats, end_request_scope, pool_stats
+from api.utils.hits import hit_counter_stats, update_hit_counts
 from api.utils.subscription import handle_subscription, get_subscriber_count, unsubscribe_email
 from api.utils.email import is_valid_email
+from api.utils.history_cache import (
+    compute_diff_html,
+    get_history_dataset,
+    get_history_payload,
+    history_cache_stats,
+    history_version,
+)
+from api.utils.responses import NO_STORE, EncodedBody, cached_page, json_response, page_etag
+from api.utils.page import load_index_page
+from api.utils.refresh import refresh_bulletin, refresh_stats
+
+CRON_SECRET = os.getenv("CRON_SECRET")
 
 app = Flask(__name__)
 
@@ -20,67 +33,51 @@ COUNTRY_LABELS = {
     'philippines': 'Philippines',
 }
 
-@app.route("/", methods=["GET", "POST"])
-def check_bulletin():
-    user_agent = (request.headers.get("User-Agent") or "").lower()
-    is_bot = any(kw in user_agent for kw in [
-        "bot", "crawler", "spider", "slurp", "curl", "wget", "python",
-        "scraper", "headless", "phantom", "lighthouse", "pingdom",
-        "uptimerobot", "monitor", "check", "scan", "fetch",
-    ])
-    visitor_ip = request.headers.get("x-forwarded-for", request.remote_addr)
-    hits = update_hit_counts(ip=visitor_ip if not is_bot else None)
-    subscriber_count = get_subscriber_count()
-
-    # Use cached bulletin if available, otherwise scrape and cache
-    cache = get_cached_bulletin()
-    if cache and cache["result"]:
-        result = cache["result"]
-        bulletin_month = cache["bulletin_month"]
-    else:
-        result, bulletin_month = run_check(return_month=True)
-        if bulletin_month:
-            save_cached_bulletin(result, bulletin_month)
-
-    subs_msg = ""
-    if request.method == "POST":
-        email = request.form.get("email")
-        unsubscribe = request.form.get("unsubscribe") == "on"
-        if email:
-            if is_valid_email(email):
-                subs_msg = handle_subscription(email, result, bulletin_month, unsubscribe=unsubscribe)
-            else:
-                subs_msg = "<p>❌ Invalid email address provided.</p>"
-
-    # Category + country selection
-    category = request.args.get('category', '2nd')
-    country = request.args.get('country', 'all_other')
+# Each request borrows one pooled DB connection, on its first query, and uses it for every helper
+@app.before_request
+def open_db_scope():
+    begin_request_scope()
+
+@app.teardown_request
+def close_db_scope(error=None):
+    end_request_scope(error)
+
+BOT_KEYWORDS = [
+    "bot", "crawler", "spider", "slurp", "curl", "wget", "python",
+    "scraper", "headless", "phantom", "lighthouse", "pingdom",
+    "uptimerobot", "monitor", "check", "scan", "fetch",
+]
+
+# Shared with the ASGI app (api/asgi.py), which serves the same routes
+def selected_series(args):
+    """(category, country) from the query string, defaulting unknown values."""
+    category = args.get('category', '2nd')
+    country = args.get('country', 'all_other')
     if category not in VALID_CATEGORIES:
         category = '2nd'
     if country not in COUNTRY_LABELS:
         country = 'all_other'
-
+    return category, country
+
+def index_validators(cache, category, country):
+    """(etag, last_modified) for "/" served from bulletin_cache. The page only
+    changes when the cron job refreshes bulletin_cache."""
+    last_modified = cache["last_fetched"]
+    if last_modified.tzinfo is None:
+        # A TIMESTAMP (not TIMESTAMPTZ) column written with NOW(): UTC on our
+        # servers; If-Modified-Since is always offset-aware
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return page_etag(cache["bulletin_month"], last_modified.isoformat(), category, country), last_modified
+
+def index_context(result, subs_msg, latest, category, country):
     # Compute change from previous bulletin
     fad_diff_html = ''
     filing_diff_html = ''
-    latest = get_latest_history(2, category=category, country=country)
     if len(latest) >= 2:
         curr, prev = latest[0], latest[1]
-        fad_diff_html = compute_diff_html(
-            curr['final_action_date'], prev['final_action_date'],
-            curr['bulletin_month'], prev['bulletin_month']
-        )
-        filing_diff_html = compute_diff_html(
-            curr['filing_date'], prev['filing_date'],
-            curr['bulletin_month'], prev['bulletin_month']
-        )
-
-    return render_template(
-        "index.html",
-        hits=hits,
-        subscriber_count=subscriber_count,
-        current_month=datetime.utcnow().strftime('%Y-%m'),
-        current_date=datetime.utcnow().strftime('%Y-%m-%d'),
+        fad_diff_html = compute_diff_html(curr, prev, 'fad')
+        filing_diff_html = compute_diff_html(curr, prev, 'filing')
+    return dict(
         result=result,
         subs_msg=subs_msg,
         fad_diff=json.dumps(fad_diff_html),
@@ -91,6 +88,118 @@ def check_bulletin():
         country_label=COUNTRY_LABELS[country],
     )
 
+def subscribe_from_form(form, bulletin):
+    """Handle the subscribe/unsubscribe form for the bulletin entry shown;
+    returns the message to show."""
+    email = form.get("email")
+    unsubscribe = form.get("unsubscribe") == "on"
+    if not email:
+        return ""
+    if not is_valid_email(email):
+        return "<p>❌ Invalid email address provided.</p>"
+    return handle_subscription(email, email_fragment(bulletin), bulletin["bulletin_month"], unsubscribe=unsubscribe)
+
+def stats_body(hits, subscribers):
+    now = datetime.utcnow()
+    return {
+        "total": int(hits["total"]),
+        "monthly": int(hits["monthly"]),
+        "daily": int(hits["daily"]),
+        "month": now.strftime('%Y-%m'),
+        "date": now.strftime('%Y-%m-%d'),
+        "subscribers": subscribers,
+    }
+
+def history_validator(category, country):
+    version = history_version()
+    return page_etag('history', version, category, country) if version is not None else None
+
+def history_context(payload, category, country):
+    return dict(
+        history=payload['history'],
+        chart_fad=payload['chart_fad'],
+        chart_filing=payload['chart_filing'],
+        entry_count=payload['entry_count'],
+        current_category=category,
+        category_label=CATEGORY_LABELS[category],
+        current_country=country,
+        country_label=COUNTRY_LABELS[country],
+    )
+
+def is_authorized(req):
+    """Bearer CRON_SECRET, as on the cron endpoints."""
+    token = req.headers.get("Authorization", "").replace("Bearer ", "")
+    return bool(CRON_SECRET) and token == CRON_SECRET
+
+def instance_stats():
+    """Counters kept in this instance's memory."""
+    return {
+        "refresh": refresh_stats(),
+        "history_cache": history_cache_stats(),
+        "bulletin_cache": bulletin_cache_stats(),
+        "hits": hit_counter_stats(),
+        "pool": pool_stats(),
+    }
+
+def visitor_ip(req):
+    """The visitor's IP for hit counting, or None for bots."""
+    user_agent = (req.headers.get("User-Agent") or "").lower()
+    if any(kw in user_agent for kw in BOT_KEYWORDS):
+        return None
+    return req.headers.get("x-forwarded-for", req.remote_addr)
+
+@app.route("/", methods=["GET", "POST"])
+def check_bulletin():
+    # Category + country selection
+    category, country = selected_series(request.args)
+
+    # Served from this instance's memory when warm
+    page = load_index_page(category=category, country=country)
+    cache = page.cache
+    latest = page.latest_history
+
+    # Use cached bulletin if available, otherwise scrape and cache
+    etag = last_modified = None
+    if cache and cache["snapshot"]:
+        bulletin = cache
+        etag, last_modified = index_validators(cache, category, country)
+    else:
+        # Empty or unreachable cache: one shared scrape, stale copy if we have one
+        bulletin = refresh_bulletin()
+
+    subs_msg = ""
+    if request.method == "POST":
+        subs_msg = subscribe_from_form(request.form, bulletin)
+
+    def render():
+        # Formatted once per bulletin version, not per request
+        result = page_fragment(bulletin)
+        return render_template("index.html", **index_context(result, subs_msg, latest, category, country))
+
+    if request.method == "POST":
+        resp = make_response(render())
+        resp.headers["Cache-Control"] = NO_STORE
+        return resp
+    return cached_page(etag, render, last_modified=last_modified)
+
+@app.route("/api/stats", methods=["GET", "POST"])
+def stats():
+    """Visit and subscriber counts for the index page, fetched by its script
+    so the page itself stays cacheable. POST counts the visit first."""
+    hits = update_hit_counts(ip=visitor_ip(request) if request.method == "POST" else None)
+    resp = jsonify(stats_body(hits, get_subscriber_count()))
+    resp.headers["Cache-Control"] = NO_STORE
+    return resp
+
+@app.route("/api/instance_stats", methods=["GET"])
+def instance_stats_route():
+    """Per-instance counters of the warm instance that answers; requires CRON_SECRET."""
+    if not is_authorized(request):
+        return {"statusCode": 401, "body": "Unauthorized"}, 401
+    resp = jsonify({"statusCode": 200, "body": instance_stats()})
+    resp.headers["Cache-Control"] = NO_STORE
+    return resp
+
 @app.route("/unsubscribe", methods=["GET"])
 def unsubscribe():
     email = request.args.get("email", "")
@@ -98,160 +207,29 @@ def unsubscribe():
         return render_template("unsubscribe.html", message=f"✅ {email} has been unsubscribed.")
     return render_template("unsubscribe.html", message="❌ Email not found or already unsubscribed.")
 
-@app.template_filter('comma')
-def format_with_commas(value):
-    try:
-        return f"{int(value):,}"
-    except (ValueError, TypeError):
-        return value
-
-# ── History helpers ──
-
-def parse_priority_date(date_str):
-    """Parse a priority date string like '01JAN22' to a date object."""
-    if not date_str or date_str.strip().upper() in ('C', 'U', ''):
-        return None
-    date_str = date_str.strip()
-    for fmt in ("%d%b%y", "%d%b%Y"):
-        try:
-            return datetime.strptime(date_str, fmt).date()
-        except ValueError:
-            continue
-    return None
-
-def format_days(days):
-    """Format days as Y M or d. Use d only if < 30."""
-    sign = '+' if days > 0 else ''
-    abd = abs(days)
-    if abd < 30:
-        return f'{sign}{days}d'
-    y = abd // 365
-    m = (abd % 365) // 30
-    parts = []
-    if y:
-        parts.append(f'{y}Y')
-    if m:
-        parts.append(f'{m}M')
-    result = ''.join(parts)
-    return f'{sign}{result}' if days > 0 else f'-{result}'
-
-def compute_diff_html(current_str, previous_str, current_month=None, previous_month=None):
-    """Compute diff HTML between two priority date strings.
-    C is resolved to the 15th of its bulletin month."""
-    if not current_str or not previous_str:
-        return ''
-    curr = current_str.strip().upper()
-    prev = previous_str.strip().upper()
-
-    # U transitions
-    if curr == 'U' and prev == 'U':
-        return '<span style="color:#64748b;">—</span>'
-    if curr == 'U':
-        return '<span style="color:#f87171;">→ U</span>'
-    if prev == 'U':
-        return '<span style="color:#4ade80;">U →</span>'
-
-    # Resolve dates (C = 15th of bulletin month)
-    curr_date = current_month.replace(day=15) if curr == 'C' and current_month else parse_priority_date(current_str)
-    prev_date = previous_month.replace(day=15) if prev == 'C' and previous_month else parse_priority_date(previous_str)
-
-    if curr_date and prev_date:
-        diff = (curr_date - prev_date).days
-        suffix = ' (C)' if curr == 'C' else ''
-        if diff > 0:
-            return f'<span style="color:#4ade80;">▲ {format_days(diff)}{suffix}</span>'
-        elif diff < 0:
-            return f'<span style="color:#f87171;">▼ {format_days(diff)}{suffix}</span>'
-        if suffix:
-            return f'<span style="color:#64748b;">—{suffix}</span>'
-        return '<span style="color:#64748b;">—</span>'
-    return ''
-
 @app.route("/history")
 def history():
-    category = request.args.get('category', '2nd')
-    country = request.args.get('country', 'all_other')
-    if category not in VALID_CATEGORIES:
-        category = '2nd'
-    if country not in COUNTRY_LABELS:
-        country = 'all_other'
-
-    rows = get_bulletin_history(category=category, country=country)
-    history_data = []
-    for i, row in enumerate(rows):
-        entry = {
-            'bulletin_month': row['bulletin_month'],
-            'month_label': row['bulletin_month'].strftime('%b %Y'),
-            'final_action_date': row['final_action_date'] or '—',
-            'filing_date': row['filing_date'] or '—',
-            'source_url': row['source_url'],
-        }
-        if i > 0:
-            prev = rows[i - 1]
-            entry['fad_diff'] = compute_diff_html(
-                row['final_action_date'], prev['final_action_date'],
-                row['bulletin_month'], prev['bulletin_month']
-            )
-            entry['filing_diff'] = compute_diff_html(
-                row['filing_date'], prev['filing_date'],
-                row['bulletin_month'], prev['bulletin_month']
-            )
-        else:
-            entry['fad_diff'] = ''
-            entry['filing_diff'] = ''
-        history_data.append(entry)
-
-    # Build aligned chart data: Y = days from current (negative or 0)
-    # C = 0, regular dates = (priority_date - bulletin_15th).days
-    chart_fad = []
-    chart_filing = []
-    last_fad_y = None
-    last_filing_y = None
-
-    for row in rows:
-        month_iso = row['bulletin_month'].isoformat()
-        bm_mid = row['bulletin_month'].replace(day=15)
-
-        # FAD: days from current
-        fad_str = (row['final_action_date'] or '').strip().upper()
-        if fad_str == 'C':
-            fad_y = 0
-        elif fad_str and fad_str != 'U':
-            fd = parse_priority_date(row['final_action_date'])
-            fad_y = (fd - bm_mid).days if fd else last_fad_y
-        else:
-            fad_y = last_fad_y
-
-        # Filing: days from current
-        filing_str = (row['filing_date'] or '').strip().upper()
-        if filing_str == 'C':
-            filing_y = 0
-        elif filing_str and filing_str != 'U':
-            fd = parse_priority_date(row['filing_date'])
-            filing_y = (fd - bm_mid).days if fd else last_filing_y
-        else:
-            filing_y = last_filing_y
-
-        if fad_y is not None:
-            last_fad_y = fad_y
-        if filing_y is not None:
-            last_filing_y = filing_y
-
-        chart_fad.append({'x': month_iso, 'y': fad_y})
-        chart_filing.append({'x': month_iso, 'y': filing_y})
-
-    history_data.reverse()
-    return render_template(
-        "history.html",
-        history=history_data,
-        chart_fad=json.dumps(chart_fad),
-        chart_filing=json.dumps(chart_filing),
-        entry_count=len(rows),
-        current_category=category,
-        category_label=CATEGORY_LABELS[category],
-        current_country=country,
-        country_label=COUNTRY_LABELS[country],
-    )
+    category, country = selected_series(request.args)
+
+    payload = get_history_payload(category=category, country=country)
+    etag = history_validator(category, country)
+    return cached_page(etag, lambda: render_template("history.html", **history_context(payload, category, country)))
+
+# /api/history body, re-encoded only when the cached dataset object changes
+_history_body = {"dataset": None, "body": None}
+
+def history_body(dataset):
+    if _history_body["dataset"] is not dataset:
+        _history_body["body"] = EncodedBody(dataset)
+        _history_body["dataset"] = dataset
+    return _history_body["body"]
+
+@app.route("/api/history")
+def history_api():
+    """Every category/country series in one columnar document."""
+    version, dataset = get_history_dataset()
+    # Not a stored version (rendered on the spot, or the empty fallback): keep it out of caches
+    return json_response(history_body(dataset), cacheable=version is not None)
 
 
 if __name__ == "__main__":
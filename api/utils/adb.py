@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import json
+import re
+from contextlib import asynccontextmanager
+
+from api.utils.db import DB_POOL_MAX, DB_POOL_MIN, DB_URL
+
+# asyncpg pool for the ASGI app (api/asgi.py). Unlike the Flask app there is
+# no per-request connection: every helper borrows its own, so the queries of
+# one request can run concurrently. asyncpg is optional (requirements-async.txt).
+_pool = {"loop": None, "pool": None}  # pool is a Future while being created
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+@functools.lru_cache(maxsize=None)
+def pg(sql):
+    """Rewrite psycopg2 placeholders (%s, %(name)s) as asyncpg's $1, $2, ...
+    so both drivers run the same statement. Named parameters are numbered in
+    order of first use and passed positionally in that order."""
+    names = {}
+    count = 0
+
+    def number(match):
+        nonlocal count
+        if match.group(0) == "%%":
+            return "%"
+        name = match.group(1)
+        if name and name in names:
+            return f"${names[name]}"
+        count += 1
+        if name:
+            names[name] = count
+        return f"${count}"
+
+    return _PLACEHOLDER.sub(number, sql)
+
+async def _init_connection(conn):
+    # Match psycopg2, which hands JSON/JSONB back already decoded
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(typename, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+async def get_pool():
+    """The pool for the running event loop, created on first use. Concurrent
+    first callers await the same creation."""
+    loop = asyncio.get_running_loop()
+    if _pool["loop"] is not loop:
+        import asyncpg
+
+        _pool["loop"] = loop
+        _pool["pool"] = asyncio.ensure_future(asyncpg.create_pool(
+            DB_URL, min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, init=_init_connection
+        ))
+    creating = _pool["pool"]
+    try:
+        return await creating
+    except Exception:
+        if _pool["pool"] is creating:
+            _pool["loop"] = _pool["pool"] = None  # retry on the next call
+        raise
+
+@asynccontextmanager
+async def acquire():
+    """Borrow a pooled connection; statements outside an explicit
+    conn.transaction() autocommit."""
+    db_pool = await get_pool()
+    async with db_pool.acquire() as conn:
+        yield conn
+
+async def close_pool():
+    creating = _pool["pool"]
+    _pool["loop"] = _pool["pool"] = None
+    if creating is not None:
+        await (await creating).close()
@@ -0,0 +1,39 @@
+import hashlib
+import math
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings. Never misses an added item;
+    reports a false positive with probability ~error_rate once `capacity`
+    items are in. Filters built with the same parameters can be merged."""
+
+    def __init__(self, capacity, error_rate=0.01, bits=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        nbytes = (self.size + 7) // 8
+        if bits is not None and len(bits) != nbytes:
+            raise ValueError(f"expected {nbytes} bytes of filter bits, got {len(bits)}")
+        self.bits = bytearray(bits) if bits is not None else bytearray(nbytes)
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def merge(self, bits):
+        """OR in the bits of another filter with the same parameters."""
+        if len(bits) != len(self.bits):
+            raise ValueError("cannot merge filters of different sizes")
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(bits, "little")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
@@ -1,21 +1,45 @@
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from datetime import datetime, timezone
+
+from api.utils.fast_parse import extract_grids
+from api.utils.http_cache import conditional_get, conditional_get_async
 
 BASE_URL = "https://travel.state.gov"
 INDEX_URL = f"{BASE_URL}/content/travel/en/legal/visa-law0/visa-bulletin.html"
 
+# Bulletin table extraction: "bs4" builds the full DOM, "stream" uses the
+# single-pass extractor in fast_parse (validate with scripts/compare_parsers.py)
+BULLETIN_PARSER = os.getenv("BULLETIN_PARSER", "bs4")
+
 def get_bulletin_date_from_slug(slug):
     parts = slug.split("/")[-1].replace("visa-bulletin-for-", "").replace(".html", "")
     month_name, year = parts.split("-")
     return month_name.capitalize(), year
 
+# Parsed pages keyed by URL, reused while the content hash is unchanged
+_soups = {}
+
+def soup_for(page):
+    cached = _soups.get(page.url)
+    if cached and cached[0] == page.content_hash:
+        return cached[1]
+    soup = BeautifulSoup(page.content, "html.parser")
+    _soups[page.url] = (page.content_hash, soup)
+    return soup
+
+def _fetch_soup(url):
+    return soup_for(conditional_get(url))
+
 # Scraping Functions
 def fetch_index_page():
     try:
-        resp = requests.get(INDEX_URL)
-        resp.raise_for_status()
-        return BeautifulSoup(resp.content, "html.parser")
+        return _fetch_soup(INDEX_URL)
     except Exception as e:
         raise RuntimeError(f"Failed to fetch index page: {e}")
 
@@ -39,17 +63,23 @@ def find_current_bulletin_link(soup):
 
 def fetch_bulletin_page(link):
     try:
-        resp = requests.get(link)
-        resp.raise_for_status()
-        return BeautifulSoup(resp.content, "html.parser")
+        return _fetch_soup(link)
     except Exception as e:
         raise RuntimeError(f"Failed to fetch bulletin page: {e}")
 
-def extract_target_tables(soup):
+def extract_bulletin_grids(content, engine=None, marker="Employment-"):
+    """Employment table grids from raw bulletin HTML, using `engine` or the
+    configured BULLETIN_PARSER. Raises ValueError when no table matches."""
+    if (engine or BULLETIN_PARSER) == "stream":
+        return extract_grids(content, marker=marker)
+    soup = BeautifulSoup(content, "html.parser")
+    return [table_grid(t) for t in extract_target_tables(soup, marker=marker)]
+
+def extract_target_tables(soup, marker="Employment-"):
     tables = []
     for bold in soup.find_all("b"):
         text = bold.get_text()
-        if "Employment-" in text:
+        if marker in text:
             table = bold.find_parent("table")
             if table and table not in tables:
                 tables.append(table)
@@ -66,36 +96,62 @@ COUNTRY_COLUMNS = {
     'philippines': 5,
 }
 
-def extract_employment_data(soup):
-    """Extract employment data for all categories and countries.
-    Returns list of {category, country, fad, filing} or None."""
-    try:
-        tables = extract_target_tables(soup)
-    except ValueError:
-        return None
+# Tags that end a cell. html.parser does not imply the end tags HTML lets
+# pages omit, so whatever follows an unclosed <td> or <tr> is parsed as its
+# children; browsers (and fast_parse) end the cell or row there instead.
+_CELL_BREAKS = ("table", "tr", "td", "th")
+
+def _cell_strings(cell):
+    for child in cell.children:
+        if isinstance(child, Tag):
+            if child.name not in _CELL_BREAKS:
+                yield from _cell_strings(child)
+        elif type(child) in (NavigableString, CData):
+            text = child.strip()
+            if text:
+                yield text
 
-    def _get_all_category_values(table):
-        results = {}
-        for row in table.select("tr"):
-            cells = row.find_all(["th", "td"])
-            if not cells:
-                continue
-            first_cell = cells[0].get_text(strip=True).replace('\xa0', ' ')
-            cat = None
-            for c in CATEGORIES:
-                if c in first_cell:
-                    cat = c
-                    break
-            if not cat:
-                continue
-            results[cat] = {}
-            for country, idx in COUNTRY_COLUMNS.items():
-                if idx < len(cells):
-                    results[cat][country] = cells[idx].get_text(strip=True).replace('\xa0', ' ')
-        return results
-
-    fad_data = _get_all_category_values(tables[0]) if tables else {}
-    filing_data = _get_all_category_values(tables[1]) if len(tables) > 1 else {}
+def table_grid(table):
+    """Flatten a bs4 table into rows of (compact, spaced) cell texts, the
+    two get_text(strip=True) forms used for records and for display. Rows
+    and cells end where HTML implies their end tags, and nested tables are
+    left out, as in fast_parse."""
+    grid = []
+    for row in table.find_all("tr"):
+        if row.find_parent("table") is not table:
+            continue
+        cells = [
+            list(_cell_strings(cell))
+            for cell in row.find_all(["th", "td"])
+            if cell.find_parent("tr") is row
+        ]
+        grid.append([("".join(parts), " ".join(parts)) for parts in cells])
+    return grid
+
+def _category_values(grid):
+    results = {}
+    for cells in grid:
+        if not cells:
+            continue
+        first_cell = cells[0][0].replace('\xa0', ' ')
+        cat = None
+        for c in CATEGORIES:
+            if c in first_cell:
+                cat = c
+                break
+        if not cat:
+            continue
+        results[cat] = {}
+        for country, idx in COUNTRY_COLUMNS.items():
+            if idx < len(cells):
+                results[cat][country] = cells[idx][0].replace('\xa0', ' ')
+    return results
+
+def records_from_grids(grids):
+    """Build {category, country, fad, filing} records from the Final Action
+    and Dates for Filing grids. Returns None if nothing matched."""
+    fad_data = _category_values(grids[0]) if grids else {}
+    filing_data = _category_values(grids[1]) if len(grids) > 1 else {}
 
     records = []
     for cat in CATEGORIES:
@@ -106,6 +162,15 @@ def extract_employment_data(soup):
                 records.append({'category': cat, 'country': country, 'fad': fad, 'filing': filing})
     return records if records else None
 
+def extract_employment_data(soup):
+    """Extract employment data for all categories and countries.
+    Returns list of {category, country, fad, filing} or None."""
+    try:
+        tables = extract_target_tables(soup)
+    except ValueError:
+        return None
+    return records_from_grids([table_grid(t) for t in tables])
+
 def extract_eb2_all_other(soup):
     """Backward-compatible wrapper for EB-2 All Other."""
     records = extract_employment_data(soup)
@@ -117,58 +182,68 @@ def extract_eb2_all_other(soup):
     return None, None
 
 # Formatting Functions
+_HEADER_STYLE = (
+    'style="background-color:#06284c; color:#ffffff; padding:10px 14px;'
+    ' font-size:14px; font-weight:600; text-align:left;'
+    ' border-bottom:2px solid #0e3d6b; font-variant-numeric:tabular-nums;"'
+)
+_CELL_STYLE = (
+    'style="padding:10px 14px; border-bottom:1px solid #e2e8f0;'
+    ' font-size:13px; text-align:left; font-variant-numeric:tabular-nums;"'
+)
+_TABLE_OPEN = (
+    '<table width="100%" cellspacing="0" cellpadding="0"'
+    ' style="border-collapse:collapse; border:1px solid #d1d9e6;'
+    ' border-radius:8px; overflow:hidden; font-family:Arial, sans-serif;">'
+)
+_HIGHLIGHT_ROW = '<tr class="eb2-row" style="background-color:#fff3cd;">'
+_EVEN_ROW = '<tr style="background-color:#ffffff;">'
+_ODD_ROW = '<tr style="background-color:#f0f4fa;">'
+
 def format_table_html(table):
-    header_style = (
-        'style="background-color:#06284c; color:#ffffff; padding:10px 14px;'
-        ' font-size:14px; font-weight:600; text-align:left;'
-        ' border-bottom:2px solid #0e3d6b; font-variant-numeric:tabular-nums;"'
-    )
-    highlight_row_style = 'style="background-color:#fff3cd;"'
-    odd_row_style = 'style="background-color:#f0f4fa;"'
-    even_row_style = 'style="background-color:#ffffff;"'
-    cell_style = (
-        'style="padding:10px 14px; border-bottom:1px solid #e2e8f0;'
-        ' font-size:13px; text-align:left; font-variant-numeric:tabular-nums;"'
-    )
+    return format_grid_html(table_grid(table))
 
-    table_html = (
-        '<table width="100%" cellspacing="0" cellpadding="0"'
-        ' style="border-collapse:collapse; border:1px solid #d1d9e6;'
-        ' border-radius:8px; overflow:hidden; font-family:Arial, sans-serif;">'
-    )
-    for row_index, row in enumerate(table.select("tr"), start=1):
+def display_rows(grid):
+    """The spaced cell texts of a grid, as kept in the stored snapshot."""
+    return [[spaced.replace('\xa0', ' ') for _, spaced in cells] for cells in grid]
+
+def format_grid_html(grid):
+    return format_rows_html(display_rows(grid))
+
+def format_rows_html(rows):
+    """Styled table for rows of cell texts; the first row is the header."""
+    parts = [_TABLE_OPEN]
+    for row_index, cells in enumerate(rows, start=1):
         if row_index == 1:
-            row_attr = ""
-        elif row_index == 3:
-            row_attr = f' class="eb2-row" {highlight_row_style}'
-        elif row_index % 2 == 0:
-            row_attr = f" {even_row_style}"
+            parts.append("<tr>")
+            for text in cells:
+                parts.append(f"<th {_HEADER_STYLE}>{_shorten_label(text)}</th>")
         else:
-            row_attr = f" {odd_row_style}"
-        table_html += f"<tr{row_attr}>"
-        for col in row.find_all(["th", "td"]):
-            text = col.get_text(separator=' ', strip=True).replace('\xa0', ' ')
-            text = _shorten_label(text)
-            if row_index == 1:
-                table_html += f"<th {header_style}>{text}</th>"
+            if row_index == 3:
+                parts.append(_HIGHLIGHT_ROW)
+            elif row_index % 2 == 0:
+                parts.append(_EVEN_ROW)
             else:
-                table_html += f"<td {cell_style}>{text}</td>"
-        table_html += "</tr>"
-    table_html += "</table>"
-    return table_html
+                parts.append(_ODD_ROW)
+            for text in cells:
+                parts.append(f"<td {_CELL_STYLE}>{_shorten_label(text)}</td>")
+        parts.append("</tr>")
+    parts.append("</table>")
+    return "".join(parts)
+
+_LABELS = {
+    "All Chargeability Areas Except Those Listed": "All Other",
+    "CHINA- mainland born": "China",
+    "CHINA-mainland born": "China",
+    "Certain Religious Workers": "Religious Workers",
+    "Employment- based": "Category",
+    "Employment-based": "Category",
+}
 
 def _shorten_label(text):
-    replacements = {
-        "All Chargeability Areas Except Those Listed": "All Other",
-        "CHINA- mainland born": "China",
-        "CHINA-mainland born": "China",
-        "Certain Religious Workers": "Religious Workers",
-        "Employment- based": "Category",
-        "Employment-based": "Category",
-    }
-    for long, short in replacements.items():
-        if text == long:
-            return short
+    short = _LABELS.get(text)
+    if short is not None:
+        return short
     # Shorten 5th preference variants — keywords may be inside or outside parens
     if text.startswith("5th"):
         if "High Unemployment" in text:
@@ -204,9 +279,11 @@ def format_message(matched_link, bulletin_month, bulletin_year, final_action_htm
         msg += filing_dates_html
     return msg
 
-def append_last_updated_time(msg):
-    from zoneinfo import ZoneInfo
-    utc_iso = datetime.now(ZoneInfo("UTC")).strftime("%Y-%m-%dT%H:%M:%SZ")
+def append_last_updated_time(msg, updated_at=None):
+    """msg followed by the page's last-updated clock, set to updated_at
+    (default now); the page script draws it."""
+    updated_at = updated_at or datetime.now(timezone.utc)
+    utc_iso = updated_at.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
     msg += f"""
     <div id="last-updated-wrap" data-utc="{utc_iso}" style="margin-top:24px; display:flex; flex-direction:column; align-items:center;">
@@ -216,38 +293,174 @@ def append_last_updated_time(msg):
     """
     return msg
 
+def error_html(error):
+    return f"<p>❌ An error occurred: {error}</p>"
+
+# Rendered fragments keyed by (kind, content hash[, last_fetched]): a warm
+# instance formats each bulletin version once per kind
+_fragments = OrderedDict()
+_FRAGMENT_MEMO_SIZE = 8
+
+def _memoized(key, render):
+    if key[1] is None:
+        return render()
+    html = _fragments.get(key)
+    if html is None:
+        html = _fragments[key] = render()
+        if len(_fragments) > _FRAGMENT_MEMO_SIZE:
+            _fragments.popitem(last=False)
+    else:
+        _fragments.move_to_end(key)
+    return html
+
+def _render_message(stored):
+    year, month_name = stored["bulletin_month"].split("-")
+    tables = stored["tables"]
+    final_action_html = format_rows_html(tables[0])
+    filing_dates_html = format_rows_html(tables[1]) if len(tables) > 1 else ""
+    return format_message(stored["link"], month_name, year, final_action_html, filing_dates_html)
+
+def email_fragment(entry):
+    """Email body for a bulletin entry ({snapshot, bulletin_month,
+    last_fetched, content_hash}, as read from bulletin_cache): the
+    formatted tables, or the error of a failed check."""
+    if not entry.get("snapshot"):
+        return error_html(entry.get("error"))
+    return _memoized(("email", entry["content_hash"]), lambda: _render_message(entry["snapshot"]))
+
+def page_fragment(entry):
+    """The bulletin as shown on "/": email_fragment() and the last-updated
+    clock at the entry's last_fetched."""
+    if not entry.get("snapshot"):
+        return error_html(entry.get("error"))
+    return _memoized(
+        ("page", entry["content_hash"], entry["last_fetched"]),
+        lambda: append_last_updated_time(email_fragment(entry), entry["last_fetched"]),
+    )
+
+def bulletin_month_date(bulletin_month):
+    """First day of a "YYYY-Month" bulletin month as a date, or None."""
+    if not bulletin_month:
+        return None
+    year, month_name = bulletin_month.split("-")
+    return datetime.strptime(f"{month_name} {year}", "%B %Y").date()
+
+@dataclass
+class BulletinSnapshot:
+    """One parse of a bulletin page: the table grids and the records,
+    computed together. stored() is the compact form kept in bulletin_cache;
+    the page and email HTML are rendered from it (page_fragment, email_fragment)."""
+    link: str | None
+    bulletin_month: str                # e.g. "2026-October"; "" when the check failed
+    grids: list = field(default_factory=list)
+    records: list | None = None
+    content_hash: str | None = None    # sha256 of the page HTML
+    table_hash: str | None = None      # sha256 of the link and tables: what the cache and history hold
+    error: str | None = None
+
+    @property
+    def month_date(self):
+        """First day of the bulletin month as a date, or None."""
+        return bulletin_month_date(self.bulletin_month)
+
+    def stored(self):
+        """{link, bulletin_month, tables}: the display text of each table cell."""
+        return {
+            "link": self.link,
+            "bulletin_month": self.bulletin_month,
+            "tables": [display_rows(grid) for grid in self.grids],
+        }
+
+    def cache_entry(self, last_fetched=None):
+        """The snapshot shaped like a bulletin_cache entry, fetched now unless
+        last_fetched is given. A failed check has no snapshot, only its error."""
+        if self.error is not None:
+            return {"snapshot": None, "bulletin_month": "", "last_fetched": None,
+                    "content_hash": None, "error": self.error}
+        return {
+            "snapshot": self.stored(),
+            "bulletin_month": self.bulletin_month,
+            "last_fetched": last_fetched or datetime.now(timezone.utc),
+            "content_hash": self.table_hash,
+        }
+
+    @classmethod
+    def failed(cls, error):
+        return cls(link=None, bulletin_month="", error=str(error))
+
+# Snapshots keyed by (content hash, link, month, marker, engine); identical
+# HTML is never parsed twice within a warm instance
+_snapshots = OrderedDict()
+_SNAPSHOT_MEMO_SIZE = 16
+
+def snapshot_from_html(content, link, bulletin_month, marker="Employment-"):
+    """Parse bulletin HTML into a BulletinSnapshot.
+    Raises ValueError when the employment tables are missing."""
+    content_hash = hashlib.sha256(content).hexdigest()
+    key = (content_hash, link, bulletin_month, marker, BULLETIN_PARSER)
+    cached = _snapshots.get(key)
+    if cached:
+        _snapshots.move_to_end(key)
+        return cached
+
+    grids = extract_bulletin_grids(content, marker=marker)
+    snapshot = BulletinSnapshot(
+        link=link,
+        bulletin_month=bulletin_month,
+        grids=grids,
+        records=records_from_grids(grids),
+        content_hash=content_hash,
+        table_hash=hashlib.sha256(json.dumps([link, grids]).encode()).hexdigest(),
+    )
+    _snapshots[key] = snapshot
+    if len(_snapshots) > _SNAPSHOT_MEMO_SIZE:
+        _snapshots.popitem(last=False)
+    return snapshot
+
+def bulletin_target(index_soup):
+    """(bulletin URL, "YYYY-Month") of the current bulletin on the index page."""
+    href = find_current_bulletin_link(index_soup)
+    matched_link = BASE_URL + href if href.startswith("/") else href
+    bulletin_month, bulletin_year = get_bulletin_date_from_slug(href.split("/")[-1])
+    return matched_link, f"{bulletin_year}-{bulletin_month}"
+
 # Main Function
-def run_check(return_month=False, return_eb2=False):
+def run_check():
+    """Scrape the current bulletin and return a BulletinSnapshot. On failure
+    the snapshot has an empty bulletin_month and the error message."""
     try:
         # Step 1: Scrape the index page and find the current bulletin link
         index_soup = fetch_index_page()
-        href = find_current_bulletin_link(index_soup)
-        matched_link = BASE_URL + href if href.startswith("/") else href
 
         # Step 2: Extract month/year from the bulletin link
-        matched_slug = href.split("/")[-1]
-        bulletin_month, bulletin_year = get_bulletin_date_from_slug(matched_slug)
-
-        # Step 3: Scrape the bulletin page and extract the target tables
-        bulletin_soup = fetch_bulletin_page(matched_link)
-        tables = extract_target_tables(bulletin_soup)
-
-        # Step 4: Format the tables and message
-        final_action_html = format_table_html(tables[0])
-        filing_dates_html = format_table_html(tables[1]) if len(tables) > 1 else ""
-        msg = format_message(matched_link, bulletin_month, bulletin_year, final_action_html, filing_dates_html)
-        msg = append_last_updated_time(msg)
-
-        if return_month and return_eb2:
-            records = extract_employment_data(bulletin_soup)
-            return msg, f"{bulletin_year}-{bulletin_month}", records, matched_link
-        if return_month:
-            return msg, f"{bulletin_year}-{bulletin_month}"
-        return msg
+        matched_link, bulletin_month = bulletin_target(index_soup)
+
+        # Step 3: Fetch the bulletin page; parsing is skipped for HTML we've seen
+        try:
+            page = conditional_get(matched_link)
+        except Exception as e:
+            raise RuntimeError(f"Failed to fetch bulletin page: {e}")
+        return snapshot_from_html(page.content, matched_link, bulletin_month)
+    except Exception as e:
+        return BulletinSnapshot.failed(e)
+
+async def run_check_async():
+    """run_check() with httpx for the two fetches. Parsing is CPU-bound and
+    runs in a worker thread so it does not stall the event loop."""
+    import httpx
+
+    try:
+        async with httpx.AsyncClient() as client:
+            try:
+                index_page = await conditional_get_async(INDEX_URL, client)
+            except Exception as e:
+                raise RuntimeError(f"Failed to fetch index page: {e}")
+            index_soup = await asyncio.to_thread(soup_for, index_page)
+            matched_link, bulletin_month = bulletin_target(index_soup)
+            try:
+                page = await conditional_get_async(matched_link, client)
+            except Exception as e:
+                raise RuntimeError(f"Failed to fetch bulletin page: {e}")
+        return await asyncio.to_thread(snapshot_from_html, page.content, matched_link, bulletin_month)
     except Exception as e:
-        error_msg = f"<p>❌ An error occurred: {str(e)}</p>"
-        if return_month and return_eb2:
-            return error_msg, "", None, None
-        if return_month:
-            return error_msg, ""
-        return error_msg
+        return BulletinSnapshot.failed(e)
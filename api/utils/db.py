@@ -1,101 +1,543 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import Json, execute_values
+
+from api.utils.priority_date import normalize_priority_date
 
 DB_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+# Connections idle for longer than this are pinged before being handed out
+DB_HEALTH_CHECK_AFTER = float(os.getenv("DB_HEALTH_CHECK_AFTER", "30"))
+# Seconds a warm instance serves its copy of bulletin_cache before revalidating
+BULLETIN_CACHE_TTL = float(os.getenv("BULLETIN_CACHE_TTL", "60"))
+
+# Process-wide pool. Module globals survive between invocations on a warm
+# serverless instance, so connections are reused across requests.
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}  # id(conn) -> monotonic time it was last returned
+_local = threading.local()
+
+_stats = {
+    "connections_opened": 0,
+    "connections_discarded": 0,
+    "checkouts": 0,
+    "in_use": 0,
+    "waits": 0,
+    "wait_time_total": 0.0,
+    "wait_time_max": 0.0,
+}
+
+# In-process copy of the bulletin_cache row, stamped by (bulletin_month, last_fetched)
+_bulletin_memo = {"entry": None, "expires": 0.0}
+_bulletin_stats = {
+    "hits": 0,         # served from memory within the TTL
+    "revalidated": 0,  # stamp unchanged; only the small columns were read
+    "misses": 0,       # full row read
+}
 
 def get_db_connection():
+    """Open a standalone connection outside the pool (scripts, one-off jobs)."""
     return psycopg2.connect(DB_URL)
 
-def get_cached_bulletin():
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DB_URL)
+    return _pool
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    if last_used is not None and time.monotonic() - last_used < DB_HEALTH_CHECK_AFTER:
+        return True
     try:
-        conn = get_db_connection()
         with conn.cursor() as cur:
-            cur.execute("SELECT result, bulletin_month, last_fetched FROM bulletin_cache WHERE id = 1")
-            row = cur.fetchone()
-        conn.close()
-        if row:
-            return {"result": row[0], "bulletin_month": row[1], "last_fetched": row[2]}
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+def _discard(conn):
+    _stats["connections_discarded"] += 1
+    _last_used.pop(id(conn), None)
+    _get_pool().putconn(conn, close=True)
+
+def _checkout(wait=True):
+    started = time.monotonic()
+    if not _slots.acquire(blocking=False):
+        if not wait:
+            raise pool.PoolError("connection pool exhausted")
+        _stats["waits"] += 1
+        _slots.acquire()
+    waited = time.monotonic() - started
+    _stats["wait_time_total"] += waited
+    _stats["wait_time_max"] = max(_stats["wait_time_max"], waited)
+
+    try:
+        db_pool = _get_pool()
+        while True:
+            conn = db_pool.getconn()
+            if id(conn) not in _last_used:
+                _stats["connections_opened"] += 1
+                _last_used[id(conn)] = None
+            if _is_healthy(conn):
+                break
+            _discard(conn)
+    except Exception:
+        _slots.release()
+        raise
+    _stats["checkouts"] += 1
+    _stats["in_use"] += 1
+    return conn
+
+def _checkin(conn, discard=False):
+    try:
+        if discard or conn.closed:
+            _discard(conn)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            _get_pool().putconn(conn)
+    finally:
+        _stats["in_use"] -= 1
+        _slots.release()
+
+def _rollback(conn):
+    """Roll back and report whether the connection should be dropped."""
+    try:
+        conn.rollback()
+        return False
+    except Exception:
+        return True
+
+@contextmanager
+def db_connection(scoped=True, readonly=False):
+    """Borrow a pooled connection for one unit of work.
+
+    Commits on success and rolls back on error. Inside a request scope the
+    request's connection is reused and the work runs in a savepoint, so a
+    failed helper does not abort the rest of the request's transaction. The
+    request's connection is checked out by its first helper, not up front.
+
+    readonly=True marks a helper that only reads. Until the request has
+    written anything it runs without the savepoint round trips; on error
+    the transaction, which holds nothing to keep, is rolled back instead.
+
+    scoped=False always commits on a connection of its own, for bookkeeping
+    that must not ride on (or hold locks until the end of) the request's
+    transaction. It fails rather than waits for a free connection while the
+    thread holds the request's, which could otherwise wait on itself."""
+    shared = getattr(_local, "conn", None)
+    wait = scoped or shared is None
+    if not scoped:
+        shared = None
+    elif shared is None and getattr(_local, "scoped", False):
+        shared = _local.conn = _checkout()
+    if shared is not None and readonly and not getattr(_local, "wrote", False):
+        try:
+            yield shared
+        except Exception:
+            _rollback(shared)
+            raise
+        return
+    if shared is not None:
+        _local.wrote = True
+        with shared.cursor() as cur:
+            cur.execute("SAVEPOINT helper")
+        try:
+            yield shared
+        except Exception:
+            with shared.cursor() as cur:
+                cur.execute("ROLLBACK TO SAVEPOINT helper")
+            raise
+        with shared.cursor() as cur:
+            cur.execute("RELEASE SAVEPOINT helper")
+        return
+
+    conn = _checkout(wait=wait)
+    discard = False
+    try:
+        yield conn
+        conn.commit()
     except Exception:
-        pass
+        discard = _rollback(conn)
+        raise
+    finally:
+        _checkin(conn, discard=discard)
+
+def begin_request_scope():
+    """Share one pooled connection among the helpers the current thread runs
+    until end_request_scope. Nothing is checked out until a helper needs the
+    database, so requests served from memory never touch the pool."""
+    _local.scoped = True
+    _local.wrote = False
+
+def end_request_scope(error=None):
+    """Commit (or roll back on error) and return the request's connection,
+    if one was taken."""
+    _local.scoped = False
+    _local.wrote = False
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    discard = False
+    if error is None:
+        try:
+            conn.commit()
+        except Exception:
+            discard = _rollback(conn)
+    else:
+        discard = _rollback(conn)
+    _checkin(conn, discard=discard)
+
+def pool_stats():
+    """Snapshot of pool size and wait-time metrics."""
+    stats = dict(_stats)
+    stats["pool_min"] = DB_POOL_MIN
+    stats["pool_max"] = DB_POOL_MAX
+    stats["pool_size"] = len(_last_used)
+    stats["wait_time_avg"] = stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    return stats
+
+def _remember_bulletin(entry):
+    _bulletin_memo["entry"] = entry
+    _bulletin_memo["expires"] = time.monotonic() + BULLETIN_CACHE_TTL
+    return dict(entry)
+
+# The snapshot is only returned when the stamp differs from the one passed in
+BULLETIN_REVALIDATE_SQL = (
+    "SELECT CASE WHEN bulletin_month = %s AND last_fetched = %s THEN NULL ELSE snapshot END, "
+    "bulletin_month, last_fetched, content_hash FROM bulletin_cache WHERE id = 1"
+)
+
+def _bulletin_memo_hit():
+    entry = _bulletin_memo["entry"]
+    if entry is not None and time.monotonic() < _bulletin_memo["expires"]:
+        _bulletin_stats["hits"] += 1
+        return dict(entry)
     return None
 
-def save_cached_bulletin(result, bulletin_month):
+def _revalidated_bulletin(entry, row):
+    if not row:
+        return None
+    if row[0] is None and entry is not None:
+        _bulletin_stats["revalidated"] += 1
+        return _remember_bulletin(entry)
+    _bulletin_stats["misses"] += 1
+    return _remember_bulletin(
+        {"snapshot": row[0], "bulletin_month": row[1], "last_fetched": row[2], "content_hash": row[3]}
+    )
+
+def get_cached_bulletin(fresh=False):
+    """bulletin_cache row as {snapshot, bulletin_month, last_fetched, content_hash}, or None.
+    Served from memory for BULLETIN_CACHE_TTL seconds (unless `fresh`), then
+    revalidated against the (bulletin_month, last_fetched) stamp; the
+    snapshot is only re-read when the stamp changed. snapshot is None for a
+    row written before migration 010."""
+    hit = None if fresh else _bulletin_memo_hit()
+    if hit is not None:
+        return hit
+    entry = _bulletin_memo["entry"]
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO bulletin_cache (id, result, bulletin_month, last_fetched)
-                VALUES (1, %s, %s, NOW())
-                ON CONFLICT (id)
-                DO UPDATE SET result = EXCLUDED.result,
-                              bulletin_month = EXCLUDED.bulletin_month,
-                              last_fetched = NOW()
-                """,
-                (result, bulletin_month),
+                BULLETIN_REVALIDATE_SQL,
+                (entry and entry["bulletin_month"], entry and entry["last_fetched"]),
             )
-        conn.commit()
-        conn.close()
+            row = cur.fetchone()
+    except Exception:
+        return dict(entry) if entry else None  # keep serving the last copy
+    return _revalidated_bulletin(entry, row)
+
+async def get_cached_bulletin_async(fresh=False):
+    """get_cached_bulletin() over asyncpg, sharing its in-process copy."""
+    from api.utils.adb import acquire, pg
+
+    hit = None if fresh else _bulletin_memo_hit()
+    if hit is not None:
+        return hit
+    entry = _bulletin_memo["entry"]
+    try:
+        async with acquire() as conn:
+            row = await conn.fetchrow(
+                pg(BULLETIN_REVALIDATE_SQL),
+                entry and entry["bulletin_month"], entry and entry["last_fetched"],
+            )
+    except Exception:
+        return dict(entry) if entry else None
+    return _revalidated_bulletin(entry, row)
+
+def memoized_bulletin():
+    """This instance's bulletin_cache copy while it is within
+    BULLETIN_CACHE_TTL, else None. Never touches the database."""
+    return _bulletin_memo_hit()
+
+def cached_bulletin_stamp():
+    """(bulletin_month, last_fetched) of this instance's copy, or None."""
+    entry = _bulletin_memo["entry"]
+    return (entry["bulletin_month"], entry["last_fetched"]) if entry else None
+
+# Leaves the row (and last_fetched, the page validator) untouched when the
+# same bulletin's tables hash the same; nothing is returned then. The old
+# pre-rendered result column is cleared by the first write.
+SAVE_BULLETIN_SQL = """
+    INSERT INTO bulletin_cache (id, snapshot, bulletin_month, last_fetched, content_hash)
+    VALUES (1, %s, %s, NOW(), %s)
+    ON CONFLICT (id)
+    DO UPDATE SET snapshot = EXCLUDED.snapshot,
+                  result = NULL,
+                  bulletin_month = EXCLUDED.bulletin_month,
+                  last_fetched = NOW(),
+                  content_hash = EXCLUDED.content_hash
+    WHERE EXCLUDED.content_hash IS NULL
+       OR bulletin_cache.snapshot IS NULL
+       OR bulletin_cache.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+       OR bulletin_cache.bulletin_month IS DISTINCT FROM EXCLUDED.bulletin_month
+    RETURNING last_fetched
+"""
+
+def save_cached_bulletin(snapshot, bulletin_month, content_hash=None):
+    """Store a scraped bulletin's snapshot (BulletinSnapshot.stored()).
+    Returns False when the row already held these tables (nothing was
+    written) or the write failed."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(SAVE_BULLETIN_SQL, (Json(snapshot), bulletin_month, content_hash))
+            row = cur.fetchone()
     except Exception:
-        pass
+        _bulletin_memo["entry"] = None
+        return False
+    if row is None:
+        return False
+    _remember_bulletin({"snapshot": snapshot, "bulletin_month": bulletin_month,
+                        "last_fetched": row[0], "content_hash": content_hash})
+    return True
+
+async def save_cached_bulletin_async(snapshot, bulletin_month, content_hash=None):
+    from api.utils.adb import acquire, pg
+
+    try:
+        async with acquire() as conn:
+            row = await conn.fetchrow(pg(SAVE_BULLETIN_SQL), snapshot, bulletin_month, content_hash)
+    except Exception:
+        _bulletin_memo["entry"] = None
+        return False
+    if row is None:
+        return False
+    _remember_bulletin({"snapshot": snapshot, "bulletin_month": bulletin_month,
+                        "last_fetched": row[0], "content_hash": content_hash})
+    return True
+
+BULLETIN_REVISION_SQL = """
+    WITH latest AS (
+        SELECT revision, content_hash FROM bulletin_revisions
+        WHERE bulletin_month = %(month)s ORDER BY revision DESC LIMIT 1
+    )
+    INSERT INTO bulletin_revisions (bulletin_month, revision, content_hash, source_url, grids)
+    SELECT %(month)s, COALESCE((SELECT revision FROM latest), 0) + 1, %(hash)s, %(url)s, %(grids)s
+    WHERE NOT EXISTS (SELECT 1 FROM latest WHERE content_hash = %(hash)s)
+    ON CONFLICT DO NOTHING
+    RETURNING revision
+"""
+
+def record_bulletin_revision(snapshot):
+    """Add snapshot's tables as the next revision of its month, unless they
+    are the latest revision already. Returns the new revision number, or None."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(BULLETIN_REVISION_SQL, {
+                "month": snapshot.bulletin_month,
+                "hash": snapshot.table_hash,
+                "url": snapshot.link,
+                "grids": Json(snapshot.grids),
+            })
+            row = cur.fetchone()
+    except Exception:
+        return None
+    return row[0] if row else None
+
+def bulletin_cache_stats():
+    """Counters for the in-process bulletin_cache copy."""
+    stats = dict(_bulletin_stats)
+    lookups = stats["hits"] + stats["revalidated"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] + stats["revalidated"]) / lookups if lookups else 0.0
+    return stats
 
 def get_bulletin_history(category='2nd', country='all_other'):
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
             cur.execute(
-                "SELECT bulletin_month, final_action_date, filing_date, source_url "
+                "SELECT bulletin_month, final_action_date, filing_date, source_url, "
+                "fad_status, fad_pd, fad_days, filing_status, filing_pd, filing_days "
                 "FROM bulletin_history WHERE category = %s AND country = %s "
                 "ORDER BY bulletin_month ASC",
                 (category, country),
             )
             rows = cur.fetchall()
-        conn.close()
         return [
-            {"bulletin_month": r[0], "final_action_date": r[1], "filing_date": r[2], "source_url": r[3]}
+            {"bulletin_month": r[0], "final_action_date": r[1], "filing_date": r[2], "source_url": r[3],
+             "fad_status": r[4], "fad_pd": r[5], "fad_days": r[6],
+             "filing_status": r[7], "filing_pd": r[8], "filing_days": r[9]}
             for r in rows
         ]
     except Exception:
         return []
 
+LATEST_HISTORY_SQL = (
+    "SELECT bulletin_month, final_action_date, filing_date, "
+    "fad_status, fad_pd, filing_status, filing_pd "
+    "FROM bulletin_history WHERE category = %s AND country = %s "
+    "ORDER BY bulletin_month DESC LIMIT %s"
+)
+
+def _latest_history_rows(rows):
+    return [
+        {"bulletin_month": r[0], "final_action_date": r[1], "filing_date": r[2],
+         "fad_status": r[3], "fad_pd": r[4], "filing_status": r[5], "filing_pd": r[6]}
+        for r in rows
+    ]
+
 def get_latest_history(n=2, category='2nd', country='all_other'):
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT bulletin_month, final_action_date, filing_date "
-                "FROM bulletin_history WHERE category = %s AND country = %s "
-                "ORDER BY bulletin_month DESC LIMIT %s",
-                (category, country, n),
-            )
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(LATEST_HISTORY_SQL, (category, country, n))
             rows = cur.fetchall()
-        conn.close()
-        return [
-            {"bulletin_month": r[0], "final_action_date": r[1], "filing_date": r[2]}
-            for r in rows
-        ]
+        return _latest_history_rows(rows)
     except Exception:
         return []
 
+# get_cached_bulletin()'s revalidation and LATEST_HISTORY_SQL in one round
+# trip: one row per history row (or a single row without any), the bulletin
+# columns repeated but the snapshot only sent on the first row and only when
+# the (month, last_fetched) stamp moved. The cache columns are NULL when
+# bulletin_cache has no row.
+INDEX_PAGE_SQL = """
+    SELECT CASE WHEN COALESCE(h.pos, 1) > 1
+                  OR (c.bulletin_month = %(month)s AND c.last_fetched = %(fetched)s)
+                THEN NULL ELSE c.snapshot END,
+           c.bulletin_month, c.last_fetched, c.content_hash, c.id IS NOT NULL,
+           h.bulletin_month, h.final_action_date, h.filing_date,
+           h.fad_status, h.fad_pd, h.filing_status, h.filing_pd
+    FROM (SELECT 1) AS one
+    LEFT JOIN bulletin_cache AS c ON c.id = 1
+    LEFT JOIN LATERAL (
+        SELECT bulletin_month, final_action_date, filing_date,
+               fad_status, fad_pd, filing_status, filing_pd,
+               row_number() OVER (ORDER BY bulletin_month DESC) AS pos
+        FROM bulletin_history WHERE category = %(category)s AND country = %(country)s
+        ORDER BY bulletin_month DESC LIMIT %(n)s
+    ) AS h ON true
+    ORDER BY h.pos
+"""
+
+def _index_page_params(entry, n, category, country):
+    # In order of first use, as pg() numbers them for asyncpg
+    return {
+        "month": entry and entry["bulletin_month"],
+        "fetched": entry and entry["last_fetched"],
+        "category": category,
+        "country": country,
+        "n": n,
+    }
+
+def _index_page_rows(entry, rows):
+    rows = [tuple(r) for r in rows]
+    cache = _revalidated_bulletin(entry, rows[0][:4] if rows and rows[0][4] else None)
+    latest = _latest_history_rows([r[5:] for r in rows if r[5] is not None])
+    return cache, latest
+
+def get_cached_bulletin_with_history(n=2, category='2nd', country='all_other'):
+    """get_cached_bulletin() and get_latest_history() in one statement, for
+    a page whose in-memory copies are missing or stale. On a database error
+    the last bulletin copy is kept and history is None."""
+    entry = _bulletin_memo["entry"]
+    try:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(INDEX_PAGE_SQL, _index_page_params(entry, n, category, country))
+            rows = cur.fetchall()
+    except Exception:
+        return (dict(entry) if entry else None), None
+    return _index_page_rows(entry, rows)
+
+async def get_cached_bulletin_with_history_async(n=2, category='2nd', country='all_other'):
+    from api.utils.adb import acquire, pg
+
+    entry = _bulletin_memo["entry"]
+    try:
+        async with acquire() as conn:
+            rows = await conn.fetch(
+                pg(INDEX_PAGE_SQL), *_index_page_params(entry, n, category, country).values()
+            )
+    except Exception:
+        return (dict(entry) if entry else None), None
+    return _index_page_rows(entry, rows)
+
+HISTORY_UPSERT_SQL = """
+    INSERT INTO bulletin_history (
+        bulletin_month, category, country, final_action_date, filing_date, source_url,
+        fad_status, fad_pd, fad_days, filing_status, filing_pd, filing_days
+    )
+    VALUES %s
+    ON CONFLICT (bulletin_month, category, country) DO UPDATE SET
+        final_action_date = EXCLUDED.final_action_date,
+        filing_date = EXCLUDED.filing_date,
+        source_url = EXCLUDED.source_url,
+        fad_status = EXCLUDED.fad_status,
+        fad_pd = EXCLUDED.fad_pd,
+        fad_days = EXCLUDED.fad_days,
+        filing_status = EXCLUDED.filing_status,
+        filing_pd = EXCLUDED.filing_pd,
+        filing_days = EXCLUDED.filing_days
+    WHERE (bulletin_history.final_action_date, bulletin_history.filing_date, bulletin_history.source_url,
+           bulletin_history.fad_status, bulletin_history.fad_pd, bulletin_history.fad_days,
+           bulletin_history.filing_status, bulletin_history.filing_pd, bulletin_history.filing_days)
+          IS DISTINCT FROM
+          (EXCLUDED.final_action_date, EXCLUDED.filing_date, EXCLUDED.source_url,
+           EXCLUDED.fad_status, EXCLUDED.fad_pd, EXCLUDED.fad_days,
+           EXCLUDED.filing_status, EXCLUDED.filing_pd, EXCLUDED.filing_days)
+    RETURNING 1
+"""
+
+def history_rows(month, records, url):
+    """bulletin_history value tuples for one bulletin's records, with the
+    normalized priority-date columns computed once here."""
+    return [
+        (month, r['category'], r['country'], r.get('fad'), r.get('filing'), url,
+         *normalize_priority_date(r.get('fad'), month),
+         *normalize_priority_date(r.get('filing'), month))
+        for r in records
+    ]
+
+def upsert_history_rows(cur, rows, page_size=5000):
+    """Upsert many bulletin_history rows with one multi-row INSERT per page.
+    Later duplicates of a (month, category, country) key win, as they would
+    with one INSERT per row. Rows that would not change are not rewritten;
+    returns how many were inserted or changed."""
+    deduped = {(r[0], r[1], r[2]): r for r in rows}
+    return len(execute_values(cur, HISTORY_UPSERT_SQL, list(deduped.values()), page_size=page_size, fetch=True))
+
 def save_bulletin_history(month, records, url):
-    """Save employment data for all category/country combinations.
-    records: list of {category, country, fad, filing}"""
+    """Save employment data for all category/country combinations in one statement.
+    records: list of {category, country, fad, filing}. Returns how many rows
+    changed; the /history payloads are only rebuilt when some did."""
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            for r in records:
-                cur.execute(
-                    """
-                    INSERT INTO bulletin_history (bulletin_month, category, country, final_action_date, filing_date, source_url)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (bulletin_month, category, country) DO UPDATE SET
-                        final_action_date = EXCLUDED.final_action_date,
-                        filing_date = EXCLUDED.filing_date,
-                        source_url = EXCLUDED.source_url
-                    """,
-                    (month, r['category'], r['country'], r.get('fad'), r.get('filing'), url),
-                )
-        conn.commit()
-        conn.close()
+        with db_connection() as conn, conn.cursor() as cur:
+            changed = upsert_history_rows(cur, history_rows(month, records, url))
     except Exception:
-        pass
+        return 0
+    if changed:
+        from api.utils.history_cache import rebuild_history_payloads
+        rebuild_history_payloads()
+    return changed
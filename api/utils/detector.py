@@ -0,0 +1,137 @@
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+
+from api.utils.bulletin import INDEX_URL, bulletin_month_date, bulletin_target, soup_for
+from api.utils.db import db_connection
+from api.utils.http_cache import conditional_get
+
+# The cron calls every 15 minutes; these decide which calls actually poll.
+# Bulletins usually come out mid-month, so from BULLETIN_RELEASE_DAY until
+# next month's bulletin is out the index is polled every POLL_INTERVAL_RELEASE
+# seconds, and every POLL_INTERVAL_IDLE seconds otherwise.
+BULLETIN_RELEASE_DAY = int(os.getenv("BULLETIN_RELEASE_DAY", "8"))
+POLL_INTERVAL_RELEASE = int(os.getenv("POLL_INTERVAL_RELEASE", "900"))
+POLL_INTERVAL_IDLE = int(os.getenv("POLL_INTERVAL_IDLE", "21600"))
+# The full scrape still runs this often with an unchanged link, so
+# corrections to an already published bulletin are picked up
+FULL_CHECK_INTERVAL = int(os.getenv("FULL_CHECK_INTERVAL", "86400"))
+
+# Claims this poll when the last one is older than the interval. The row
+# lock makes overlapping cron calls agree on a single poller.
+CLAIM_POLL_SQL = """
+    UPDATE bulletin_checks AS c SET
+        polls = c.polls + 1,
+        checked_at = CASE WHEN due.ok THEN NOW() ELSE c.checked_at END,
+        not_due = c.not_due + CASE WHEN due.ok THEN 0 ELSE 1 END
+    FROM (
+        SELECT %(force)s OR checked_at IS NULL
+               OR checked_at <= NOW() - make_interval(secs => %(interval)s) AS ok
+        FROM bulletin_checks WHERE id = 1 FOR UPDATE
+    ) AS due
+    WHERE c.id = 1
+    RETURNING due.ok, c.link, c.index_hash,
+              c.full_at IS NULL OR c.full_at <= NOW() - make_interval(secs => %(full)s)
+"""
+
+_SKIP_SQL = {
+    "index unchanged": "UPDATE bulletin_checks SET index_unchanged = index_unchanged + 1 WHERE id = 1",
+    "same link": "UPDATE bulletin_checks SET link_unchanged = link_unchanged + 1, index_hash = %s WHERE id = 1",
+}
+
+@dataclass
+class Detection:
+    """Outcome of one cron call's look at the index page."""
+    run: bool                  # whether to run the full scrape
+    reason: str                # "not due", "index unchanged", "same link", "new link", "full check", "forced", "no state"
+    link: str | None = None    # bulletin link on the index page, when it was read
+    index_hash: str | None = None
+    interval: int | None = None
+
+def poll_interval(today, cached_month):
+    """Seconds between index polls on `today`, given the cached bulletin month."""
+    next_month = date(today.year + today.month // 12, today.month % 12 + 1, 1)
+    cached = bulletin_month_date(cached_month)
+    if cached is not None and cached >= next_month:
+        return POLL_INTERVAL_IDLE  # next month's bulletin is already out
+    if today.day >= BULLETIN_RELEASE_DAY:
+        return POLL_INTERVAL_RELEASE
+    return POLL_INTERVAL_IDLE
+
+def _skip(reason, *params):
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_SKIP_SQL[reason], params)
+    except Exception:
+        pass
+
+def detect_bulletin_change(cached_month, force=False):
+    """Decide whether this cron call needs the full scrape. Only the index
+    page is fetched (conditionally), and only when a poll is due; its hash
+    and bulletin link are compared with those of the last full run."""
+    interval = poll_interval(datetime.now(timezone.utc).date(), cached_month)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(CLAIM_POLL_SQL, {"force": force, "interval": interval, "full": FULL_CHECK_INTERVAL})
+            row = cur.fetchone()
+    except Exception:
+        row = None
+    if row is None:
+        # Not migrated: scrape every time, as before
+        return Detection(run=True, reason="no state", interval=interval)
+    due, link, index_hash, full_due = row
+    if not due:
+        return Detection(run=False, reason="not due", link=link, index_hash=index_hash, interval=interval)
+
+    try:
+        page = conditional_get(INDEX_URL)
+    except Exception:
+        # Let the full scrape fail and report it the usual way
+        return Detection(run=True, reason="index unreadable", interval=interval)
+    if not force and not full_due and link and page.content_hash == index_hash:
+        _skip("index unchanged")
+        return Detection(run=False, reason="index unchanged", link=link, index_hash=index_hash, interval=interval)
+
+    try:
+        new_link, _ = bulletin_target(soup_for(page))
+    except Exception:
+        return Detection(run=True, reason="index unreadable", interval=interval)
+    if not force and not full_due and new_link == link:
+        _skip("same link", page.content_hash)
+        return Detection(run=False, reason="same link", link=link, index_hash=page.content_hash, interval=interval)
+
+    reason = "forced" if force else "new link" if new_link != link else "full check"
+    return Detection(run=True, reason=reason, link=new_link, index_hash=page.content_hash, interval=interval)
+
+def record_full_run(detection, link):
+    """Remember what the full scrape saw, so the next polls can skip it."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "UPDATE bulletin_checks SET link = %s, index_hash = COALESCE(%s, index_hash), "
+                "full_at = NOW(), full_runs = full_runs + 1 WHERE id = 1",
+                (link, detection.index_hash),
+            )
+    except Exception:
+        pass
+
+def detector_stats():
+    """Counters across all instances; skipped is every cron call that did
+    not run the full scrape."""
+    try:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT polls, not_due, index_unchanged, link_unchanged, full_runs, checked_at, full_at "
+                "FROM bulletin_checks WHERE id = 1"
+            )
+            row = cur.fetchone()
+    except Exception:
+        row = None
+    if row is None:
+        return None
+    stats = dict(zip(("polls", "not_due", "index_unchanged", "link_unchanged", "full_runs"), row[:5]))
+    stats["skipped"] = stats["not_due"] + stats["index_unchanged"] + stats["link_unchanged"]
+    stats["skip_rate"] = stats["skipped"] / stats["polls"] if stats["polls"] else 0.0
+    stats["checked_at"] = row[5].isoformat() if row[5] else None
+    stats["full_at"] = row[6].isoformat() if row[6] else None
+    return stats
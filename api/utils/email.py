@@ -1,17 +1,21 @@
+import base64
 import os
 import re
 import smtplib
-from email.mime.text import MIMEText
+from urllib.parse import quote
 from email.mime.multipart import MIMEMultipart
+from email.mime.nonmultipart import MIMENonMultipart
 
 def is_valid_email(email):
     email_regex = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
     return re.match(email_regex, email) is not None
 
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
+# Set SMTP_STARTTLS=0 to talk to a plain local sink (e.g. aiosmtpd) in testing
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
 
 def _wrap_email_html(body, bulletin_month, unsubscribe_url):
     """Wrap bulletin content in a polished email template."""
@@ -62,29 +66,73 @@ def _wrap_email_html(body, bulletin_month, unsubscribe_url):
 </body>
 </html>"""
 
-def send_email(to_email, subject, body, bulletin_month):
-    try:
-        from urllib.parse import quote
-        unsubscribe_url = f"https://visa-bulletin-checker.vercel.app/unsubscribe?email={quote(to_email)}"
+UNSUBSCRIBE_URL = "https://visa-bulletin-checker.vercel.app/unsubscribe?email="
+
+_TO_MARKER = "__VBC_TO__"
+_PAYLOAD_MARKER = "__VBC_PAYLOAD__"
+_UNSUBSCRIBE_MARKER = "\x00VBC_UNSUBSCRIBE\x00"
 
-        # Strip the clock/updated section from body
-        body = re.split(r'<div id="last-updated-wrap"', body)[0]
-        # Also handle legacy format
-        body = body.split("⌛ Last updated time:")[0]
+class EmailTemplate:
+    """A bulletin email rendered once and stamped per recipient.
 
-        html = _wrap_email_html(body, bulletin_month, unsubscribe_url)
+    The body (bulletin.email_fragment()) is wrapped and split around the
+    unsubscribe link, and the MIME skeleton is serialized once; render() only
+    fills in the To header and base64-encodes the body with the recipient's
+    link."""
+
+    def __init__(self, subject, body, bulletin_month):
+        html = _wrap_email_html(body, bulletin_month, _UNSUBSCRIBE_MARKER)
+        prefix, suffix = html.split(_UNSUBSCRIBE_MARKER)
+        self._html_prefix = prefix.encode("utf-8")
+        self._html_suffix = suffix.encode("utf-8")
 
         msg = MIMEMultipart()
         msg["From"] = SMTP_USER
-        msg["To"] = to_email
+        msg["To"] = _TO_MARKER
         msg["Subject"] = subject
+        part = MIMENonMultipart("text", "html", charset="utf-8")
+        part["Content-Transfer-Encoding"] = "base64"
+        part.set_payload(_PAYLOAD_MARKER)
+        msg.attach(part)
+
+        head, rest = msg.as_string().split(_TO_MARKER)
+        middle, tail = rest.split(_PAYLOAD_MARKER)
+        self._head = head
+        self._middle = middle
+        self._tail = tail
 
-        msg.attach(MIMEText(html, "html"))
+    def render(self, to_email):
+        """Return the full MIME message for one recipient."""
+        url = (UNSUBSCRIBE_URL + quote(to_email)).encode("ascii")
+        payload = base64.encodebytes(self._html_prefix + url + self._html_suffix).decode("ascii")
+        return f"{self._head}{to_email}{self._middle}{payload}{self._tail}"
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+def build_message(to_email, subject, body, bulletin_month):
+    """Render the notification email for one recipient as a MIME string."""
+    return EmailTemplate(subject, body, bulletin_month).render(to_email)
+
+def open_smtp_session():
+    """Connect (and authenticate, when credentials are set) to the SMTP relay.
+    The caller owns the session and should quit() it when done."""
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+    try:
+        if SMTP_STARTTLS:
             server.starttls()
+        if SMTP_PASS:
             server.login(SMTP_USER, SMTP_PASS)
-            server.sendmail(SMTP_USER, to_email, msg.as_string())
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def send_email(to_email, subject, body, bulletin_month):
+    try:
+        message = build_message(to_email, subject, body, bulletin_month)
+        server = open_smtp_session()
+        try:
+            server.sendmail(SMTP_USER, to_email, message)
+        finally:
+            server.quit()
         print(f"Email sent to {to_email}")
         return True
     except Exception as e:
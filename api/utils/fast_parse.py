@@ -0,0 +1,81 @@
+from html.parser import HTMLParser
+
+_CELL_TAGS = ("td", "th")
+
+class _EmploymentTableParser(HTMLParser):
+    """Single streaming pass over a bulletin page that keeps only the text
+    grid of each table, and notes which tables contain a <b> with `marker`.
+    Nothing else on the page is materialized."""
+
+    def __init__(self, marker):
+        super().__init__(convert_charrefs=True)
+        self.marker = marker
+        self.tables = []       # every table, in document order
+        self.targets = []      # tables holding the marker, first-seen order
+        self._open = []        # stack of open tables
+        self._bold = []        # stack of open <b> text buffers
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            table = {"rows": [], "cell": None}
+            self.tables.append(table)
+            self._open.append(table)
+        elif not self._open:
+            if tag == "b":
+                self._bold.append([])
+        elif tag == "tr":
+            table = self._open[-1]
+            table["cell"] = None
+            table["rows"].append([])
+        elif tag in _CELL_TAGS:
+            table = self._open[-1]
+            if not table["rows"]:
+                table["rows"].append([])
+            table["cell"] = []
+            table["rows"][-1].append(table["cell"])
+        elif tag == "b":
+            self._bold.append([])
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            if self._open:
+                self._open.pop()
+        elif tag in _CELL_TAGS or tag == "tr":
+            if self._open:
+                self._open[-1]["cell"] = None
+        elif tag == "b" and self._bold:
+            text = "".join(self._bold.pop())
+            if self.marker in text and self._open:
+                table = self._open[-1]
+                if not any(t is table for t in self.targets):
+                    self.targets.append(table)
+
+    def handle_data(self, data):
+        for buf in self._bold:
+            buf.append(data)
+        if self._open and self._open[-1]["cell"] is not None:
+            self._open[-1]["cell"].append(data)
+
+def _grid(table):
+    grid = []
+    for row in table["rows"]:
+        cells = []
+        for chunks in row:
+            parts = [c.strip() for c in chunks]
+            parts = [p for p in parts if p]
+            cells.append(("".join(parts), " ".join(parts)))
+        grid.append(cells)
+    return grid
+
+def extract_grids(html, marker="Employment-"):
+    """Stream-parse bulletin HTML and return the (compact, spaced) text grids
+    of the employment tables, matching bulletin.table_grid() output.
+    Raises ValueError when no table is found."""
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    parser = _EmploymentTableParser(marker)
+    parser.feed(html)
+    parser.close()
+    if not parser.targets:
+        raise ValueError("Could not find the target tables in the bulletin page.")
+    return [_grid(t) for t in parser.targets]
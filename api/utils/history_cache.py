@@ -0,0 +1,306 @@
+import asyncio
+import json
+import os
+import time
+
+from psycopg2.extras import Json
+
+from api.utils.adb import acquire, pg
+from api.utils.db import db_connection
+
+# How long an instance serves its in-memory copy before re-checking the
+# stored version (the payload is rebuilt by the cron function, not this one)
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "300"))
+
+HISTORY_ROWS_QUERY = """
+    SELECT category, country, bulletin_month, final_action_date, filing_date, source_url,
+           fad_status, fad_pd, fad_days, filing_status, filing_pd, filing_days
+    FROM bulletin_history
+    ORDER BY category, country, bulletin_month
+"""
+
+# Rendered /history payloads for every category/country, keyed "category/country",
+# and the columnar dataset served by /api/history.
+# Mirrors the single history_payloads row (see migrations/005_history_payloads.sql).
+_memory = {"version": None, "payloads": None, "dataset": None, "checked": 0.0}
+_stats = {
+    "memory_hits": 0,  # served from this instance's copy
+    "db_hits": 0,      # loaded from the history_payloads row
+    "misses": 0,       # rendered from bulletin_history on the request path
+    "rebuilds": 0,     # regenerated after a bulletin_history write
+}
+
+def format_days(days):
+    """Format days as Y M or d. Use d only if < 30."""
+    sign = '+' if days > 0 else ''
+    abd = abs(days)
+    if abd < 30:
+        return f'{sign}{days}d'
+    y = abd // 365
+    m = (abd % 365) // 30
+    parts = []
+    if y:
+        parts.append(f'{y}Y')
+    if m:
+        parts.append(f'{m}M')
+    result = ''.join(parts)
+    return f'{sign}{result}' if days > 0 else f'-{result}'
+
+def compute_diff_html(current, previous, field):
+    """Compute diff HTML between the normalized `field` ('fad' or 'filing')
+    priority dates of two bulletin_history rows. C is stored as the 15th of
+    its bulletin month, so it diffs like any other date."""
+    curr = current[f'{field}_status']
+    prev = previous[f'{field}_status']
+    if not curr or not prev:
+        return ''
+
+    # U transitions
+    if curr == 'U' and prev == 'U':
+        return '<span style="color:#64748b;">—</span>'
+    if curr == 'U':
+        return '<span style="color:#f87171;">→ U</span>'
+    if prev == 'U':
+        return '<span style="color:#4ade80;">U →</span>'
+
+    diff = (current[f'{field}_pd'] - previous[f'{field}_pd']).days
+    suffix = ' (C)' if curr == 'C' else ''
+    if diff > 0:
+        return f'<span style="color:#4ade80;">▲ {format_days(diff)}{suffix}</span>'
+    elif diff < 0:
+        return f'<span style="color:#f87171;">▼ {format_days(diff)}{suffix}</span>'
+    if suffix:
+        return f'<span style="color:#64748b;">—{suffix}</span>'
+    return '<span style="color:#64748b;">—</span>'
+
+def render_history(rows):
+    """Build the /history template data for one series of bulletin_history
+    rows (oldest first): the diff table, newest first, and the chart series
+    as JSON strings."""
+    history = []
+    for i, row in enumerate(rows):
+        entry = {
+            'month_label': row['bulletin_month'].strftime('%b %Y'),
+            'final_action_date': row['final_action_date'] or '—',
+            'filing_date': row['filing_date'] or '—',
+            'source_url': row['source_url'],
+            'fad_diff': compute_diff_html(row, rows[i - 1], 'fad') if i else '',
+            'filing_diff': compute_diff_html(row, rows[i - 1], 'filing') if i else '',
+        }
+        history.append(entry)
+
+    # Chart Y = days from current (C = 0), precomputed at write time.
+    # U and unparseable months carry the previous value forward.
+    chart_fad = []
+    chart_filing = []
+    fad_y = None
+    filing_y = None
+    for row in rows:
+        month_iso = row['bulletin_month'].isoformat()
+        if row['fad_days'] is not None:
+            fad_y = row['fad_days']
+        if row['filing_days'] is not None:
+            filing_y = row['filing_days']
+        chart_fad.append({'x': month_iso, 'y': fad_y})
+        chart_filing.append({'x': month_iso, 'y': filing_y})
+
+    history.reverse()
+    return {
+        'history': history,
+        'chart_fad': json.dumps(chart_fad),
+        'chart_filing': json.dumps(chart_filing),
+        'entry_count': len(rows),
+    }
+
+def build_dataset(series):
+    """Columnar form of every series for /api/history: one shared month axis
+    (with each bulletin's source URL) and parallel arrays per series, null
+    where a series has no row for that month."""
+    months = sorted({row['bulletin_month'] for rows in series.values() for row in rows})
+    position = {month: i for i, month in enumerate(months)}
+    sources = [None] * len(months)
+    data = {}
+    for (category, country), rows in sorted(series.items()):
+        columns = {
+            name: [None] * len(months)
+            for name in ('fad', 'fad_status', 'fad_days', 'filing', 'filing_status', 'filing_days')
+        }
+        for row in rows:
+            i = position[row['bulletin_month']]
+            columns['fad'][i] = row['final_action_date']
+            columns['fad_status'][i] = row['fad_status']
+            columns['fad_days'][i] = row['fad_days']
+            columns['filing'][i] = row['filing_date']
+            columns['filing_status'][i] = row['filing_status']
+            columns['filing_days'][i] = row['filing_days']
+            sources[i] = sources[i] or row['source_url']
+        data.setdefault(category, {})[country] = columns
+    return {
+        'months': [month.isoformat() for month in months],
+        'sources': sources,
+        'series': data,
+    }
+
+def _render_all(cur):
+    cur.execute(HISTORY_ROWS_QUERY)
+    columns = [d[0] for d in cur.description]
+    series = {}
+    for r in cur.fetchall():
+        row = dict(zip(columns, r))
+        series.setdefault((row['category'], row['country']), []).append(row)
+    payloads = {f"{category}/{country}": render_history(rows) for (category, country), rows in series.items()}
+    return payloads, build_dataset(series)
+
+def _remember(version, payloads, dataset):
+    _memory["version"] = version
+    _memory["payloads"] = payloads
+    _memory["dataset"] = dataset
+    _memory["checked"] = time.monotonic()
+
+def rebuild_history_payloads():
+    """Re-render every series and store it as a new version. Called after
+    bulletin_history changes; returns the new version, or None on failure."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            payloads, dataset = _render_all(cur)
+            cur.execute(
+                """
+                INSERT INTO history_payloads (id, version, payloads, dataset, built_at)
+                VALUES (1, 1, %s, %s, NOW())
+                ON CONFLICT (id) DO UPDATE SET
+                    version = history_payloads.version + 1,
+                    payloads = EXCLUDED.payloads,
+                    dataset = EXCLUDED.dataset,
+                    built_at = EXCLUDED.built_at
+                RETURNING version
+                """,
+                (Json(payloads), Json(dataset)),
+            )
+            version = cur.fetchone()[0]
+    except Exception:
+        # Keep serving what we have; the next request re-checks the stored version
+        _memory["checked"] = 0.0
+        return None
+    _stats["rebuilds"] += 1
+    _remember(version, payloads, dataset)
+    return version
+
+# Only pulls the payloads when the stored version moved on from ours
+HISTORY_PAYLOADS_SQL = (
+    "SELECT version, CASE WHEN version = %s THEN NULL ELSE payloads END, "
+    "CASE WHEN version = %s THEN NULL ELSE dataset END "
+    "FROM history_payloads WHERE id = 1"
+)
+
+def _memory_fresh():
+    if _memory["payloads"] is not None and time.monotonic() - _memory["checked"] < HISTORY_CACHE_TTL:
+        _stats["memory_hits"] += 1
+        return True
+    return False
+
+def _use_stored(row):
+    """Adopt a HISTORY_PAYLOADS_SQL row; False when there is nothing usable."""
+    if row is not None and row[1] is None and _memory["payloads"] is not None:
+        _stats["db_hits"] += 1  # same version as ours
+        _remember(row[0], _memory["payloads"], _memory["dataset"])
+        return True
+    if row is not None and row[1] is not None and row[2] is not None:
+        _stats["db_hits"] += 1
+        _remember(row[0], row[1], row[2])
+        return True
+    return False
+
+# history_payloads (or its dataset column) missing: render from bulletin_history
+_NOT_MIGRATED = {"42P01", "42703"}  # undefined_table, undefined_column
+
+def _not_migrated(error):
+    return (getattr(error, "pgcode", None) or getattr(error, "sqlstate", None)) in _NOT_MIGRATED
+
+def _keep_stale():
+    """After a failed load or render: keep serving the copy in memory (empty
+    when there is none) without marking it fresh, so the next request retries."""
+    if _memory["payloads"] is None:
+        _memory["payloads"], _memory["dataset"] = {}, build_dataset({})
+    _memory["checked"] = 0.0
+
+def _render_missing():
+    # Never built, built before the dataset column existed, or not migrated:
+    # render now, and store it when possible
+    _stats["misses"] += 1
+    if rebuild_history_payloads() is not None:
+        return
+    try:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            payloads, dataset = _render_all(cur)
+    except Exception:
+        _keep_stale()
+        return
+    _remember(None, payloads, dataset)
+
+def _load_payloads():
+    """Make sure _memory holds current payloads and dataset."""
+    if _memory_fresh():
+        return
+    try:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(HISTORY_PAYLOADS_SQL, (_memory["version"], _memory["version"]))
+            row = cur.fetchone()
+    except Exception as e:
+        if not _not_migrated(e):
+            _keep_stale()  # database unreachable: like get_cached_bulletin, serve the last copy
+            return
+        row = None
+    if not _use_stored(row):
+        _render_missing()
+
+async def _load_payloads_async():
+    """_load_payloads() over asyncpg. The rare full render stays on the
+    sync path, in a worker thread."""
+    if _memory_fresh():
+        return
+    try:
+        async with acquire() as conn:
+            row = await conn.fetchrow(pg(HISTORY_PAYLOADS_SQL), _memory["version"], _memory["version"])
+    except Exception as e:
+        if not _not_migrated(e):
+            _keep_stale()
+            return
+        row = None
+    if not _use_stored(row):
+        await asyncio.to_thread(_render_missing)
+
+def get_history_payload(category='2nd', country='all_other'):
+    """Rendered /history data for one category/country, from memory, the
+    history_payloads row, or bulletin_history as a last resort."""
+    _load_payloads()
+    payload = _memory["payloads"].get(f"{category}/{country}")
+    if payload is None:
+        return render_history([])
+    return payload
+
+def get_history_dataset():
+    """Columnar data for every series (see build_dataset), plus its version."""
+    _load_payloads()
+    return _memory["version"], _memory["dataset"]
+
+def history_version():
+    """Version of the payloads in memory; None when they were rendered
+    without being stored."""
+    return _memory["version"]
+
+async def get_history_payload_async(category='2nd', country='all_other'):
+    await _load_payloads_async()
+    payload = _memory["payloads"].get(f"{category}/{country}")
+    if payload is None:
+        return render_history([])
+    return payload
+
+async def get_history_dataset_async():
+    await _load_payloads_async()
+    return _memory["version"], _memory["dataset"]
+
+def history_cache_stats():
+    stats = dict(_stats)
+    stats["hits"] = stats["memory_hits"] + stats["db_hits"]
+    stats["version"] = _memory["version"]
+    return stats
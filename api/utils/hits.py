@@ -1,96 +1,301 @@
-import json
-from datetime import datetime, timedelta
-from api.utils.db import get_db_connection
-
-def load_hits():
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT total, daily, monthly, last_daily_reset, last_monthly_reset FROM hit_counts LIMIT 1")
-        row = cur.fetchone()
-        if row:
-            hits = {
-                "total": row[0],
-                "daily": row[1],
-                "monthly": row[2],
-                "last_daily_reset": row[3],
-                "last_monthly_reset": row[4],
-            }
-        else:
-            hits = {"total": 0, "daily": 0, "monthly": 0, "last_daily_reset": None, "last_monthly_reset": None}
-    conn.close()
-    return hits
+import asyncio
+import atexit
+import os
+import threading
+import time
 
-def save_hits(data):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            UPDATE hit_counts
-            SET total = %s,
-                daily = %s::jsonb,
-                monthly = %s::jsonb,
-                last_daily_reset = %s,
-                last_monthly_reset = %s
-            WHERE id = 1
-            """,
-            (data["total"], json.dumps(data["daily"]), json.dumps(data["monthly"]), data["last_daily_reset"], data["last_monthly_reset"]),
-        )
-    conn.commit()
-    conn.close()
-
-def is_recent_visitor(ip):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            "SELECT 1 FROM recent_visitors WHERE ip = %s AND visited_at > NOW() - INTERVAL '1 hour' LIMIT 1",
-            (ip,),
-        )
-        found = cur.fetchone() is not None
-    conn.close()
-    return found
+import psycopg2
+from psycopg2.extras import execute_values
+
+from api.utils.adb import acquire, pg
+from api.utils.bloom import BloomFilter
+from api.utils.db import db_connection
+
+# Visits are buffered per instance and written with one atomic UPDATE once
+# HIT_FLUSH_BATCH are pending or the oldest is HIT_FLUSH_INTERVAL seconds
+# old, by the next visit or, failing one, by a timer
+HIT_FLUSH_BATCH = int(os.getenv("HIT_FLUSH_BATCH", "25"))
+HIT_FLUSH_INTERVAL = float(os.getenv("HIT_FLUSH_INTERVAL", "10"))
+
+# Day and month on the database clock (UTC), which decides rollovers
+_CLOCK_CTE = """
+    WITH clock AS (
+        SELECT (NOW() AT TIME ZONE 'UTC')::date AS today,
+               date_trunc('month', NOW() AT TIME ZONE 'UTC')::date AS month
+    )
+"""
+
+# Adds n and rolls daily/monthly over, so concurrent instances never
+# overwrite each other's increments
+FLUSH_HITS_SQL = _CLOCK_CTE + """
+    UPDATE hit_counts AS h SET
+        total = h.total + %(n)s,
+        daily = to_jsonb(%(n)s + CASE WHEN h.last_daily_reset = clock.today
+                                      THEN COALESCE((h.daily #>> '{}')::bigint, 0) ELSE 0 END),
+        monthly = to_jsonb(%(n)s + CASE WHEN h.last_monthly_reset = clock.month
+                                        THEN COALESCE((h.monthly #>> '{}')::bigint, 0) ELSE 0 END),
+        last_daily_reset = clock.today,
+        last_monthly_reset = clock.month
+    FROM clock
+    WHERE h.id = 1
+    RETURNING h.total, h.daily, h.monthly, h.last_daily_reset, h.last_monthly_reset
+"""
+
+# The same counters with the rollover applied, without writing (or locking)
+# the row, for refreshes with nothing buffered
+READ_HITS_SQL = _CLOCK_CTE + """
+    SELECT h.total,
+           to_jsonb(CASE WHEN h.last_daily_reset = clock.today
+                         THEN COALESCE((h.daily #>> '{}')::bigint, 0) ELSE 0 END),
+           to_jsonb(CASE WHEN h.last_monthly_reset = clock.month
+                         THEN COALESCE((h.monthly #>> '{}')::bigint, 0) ELSE 0 END),
+           clock.today,
+           clock.month
+    FROM hit_counts AS h, clock
+    WHERE h.id = 1
+"""
+
+# Recent visitors (one-hour dedup) are kept in Bloom filters, one per
+# VISITOR_BUCKET_SECONDS bucket, sized for VISITOR_FILTER_CAPACITY visitors
+# each, and merged with visitor_filters every VISITOR_MERGE_INTERVAL seconds
+VISITOR_WINDOW = 3600
+VISITOR_BUCKET_SECONDS = int(os.getenv("VISITOR_BUCKET_SECONDS", "600"))
+VISITOR_FILTER_CAPACITY = int(os.getenv("VISITOR_FILTER_CAPACITY", "10000"))
+VISITOR_FILTER_ERROR = float(os.getenv("VISITOR_FILTER_ERROR", "0.01"))
+VISITOR_MERGE_INTERVAL = float(os.getenv("VISITOR_MERGE_INTERVAL", "30"))
+
+_lock = threading.Lock()
+_pending = {"n": 0, "since": 0.0}
+_counts = {"hits": None, "read_at": 0.0}  # counters as of the last flush
+_filters = {}  # bucket -> BloomFilter
+_dirty = set()  # buckets with visitors not yet merged to the database
+_merged = {"at": 0.0}
+_stats = {"flushes": 0, "flushed_hits": 0, "reads": 0, "failed_flushes": 0,
+          "merges": 0, "failed_merges": 0}
+
+def _bucket(ts=None):
+    return int((time.time() if ts is None else ts) // VISITOR_BUCKET_SECONDS)
+
+def _window():
+    current = _bucket()
+    return range(current - VISITOR_WINDOW // VISITOR_BUCKET_SECONDS + 1, current + 1)
+
+def _new_filter(bits=None):
+    return BloomFilter(VISITOR_FILTER_CAPACITY, VISITOR_FILTER_ERROR, bits=bits)
 
 def record_visitor(ip):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO recent_visitors (ip, visited_at)
-            VALUES (%s, NOW())
-            ON CONFLICT (ip)
-            DO UPDATE SET visited_at = NOW()
-            """,
-            (ip,),
-        )
-        # Clean up entries older than 1 hour
-        cur.execute("DELETE FROM recent_visitors WHERE visited_at < NOW() - INTERVAL '1 hour'")
-    conn.commit()
-    conn.close()
+    """Remember ip in the current bucket. Returns False if it was already
+    seen in the last hour, by this instance or (as of the last merge) any
+    other; false positives happen at ~VISITOR_FILTER_ERROR."""
+    window = _window()
+    with _lock:
+        for b in [b for b in _filters if b < window.start]:
+            del _filters[b]
+            _dirty.discard(b)
+        if any(ip in _filters[b] for b in window if b in _filters):
+            return False
+        current = window[-1]
+        if current not in _filters:
+            _filters[current] = _new_filter()
+        _filters[current].add(ip)
+        _dirty.add(current)
+    return True
 
-def update_hit_counts(ip=None):
-    hits = load_hits()
-    now = datetime.utcnow()
-    today = now.date()
-    first_of_month = today.replace(day=1)
+def merge_visitor_filters():
+    """Push this instance's new visitors to visitor_filters and pull in
+    everyone else's, for every bucket in the window. Row locks make the
+    OR of concurrent merges lossless; the merge commits on its own, so they
+    are not held until the end of the request."""
+    window = _window()
+    with _lock:
+        dirty = {b: bytes(_filters[b].bits) for b in _dirty if b in window}
+        _dirty.difference_update(dirty)
+    try:
+        with db_connection(scoped=False) as conn, conn.cursor() as cur:
+            empty = psycopg2.Binary(bytes(len(_new_filter().bits)))
+            if dirty:
+                cur.execute(
+                    "INSERT INTO visitor_filters (bucket, bits) "
+                    "SELECT unnest(%s::bigint[]), %s ON CONFLICT (bucket) DO NOTHING",
+                    (list(dirty), empty),
+                )
+            cur.execute(
+                "SELECT bucket, bits FROM visitor_filters WHERE bucket BETWEEN %s AND %s "
+                "ORDER BY bucket FOR UPDATE",
+                (window.start, window[-1]),
+            )
+            merged = {}
+            for bucket, bits in cur.fetchall():
+                f = _new_filter()
+                if len(bits) == len(f.bits):  # else written with other filter settings
+                    f.merge(bytes(bits))
+                if bucket in dirty:
+                    f.merge(dirty[bucket])
+                merged[bucket] = f
+            if dirty:
+                execute_values(
+                    cur,
+                    "UPDATE visitor_filters AS v SET bits = d.bits, updated_at = NOW() "
+                    "FROM (VALUES %s) AS d (bucket, bits) WHERE v.bucket = d.bucket",
+                    [(b, psycopg2.Binary(bytes(merged[b].bits))) for b in dirty if b in merged],
+                    template="(%s::bigint, %s::bytea)",
+                )
+    except Exception:
+        with _lock:
+            _dirty.update(dirty)  # retry on the next merge
+        _stats["failed_merges"] += 1
+        return False
+    with _lock:
+        for bucket, f in merged.items():
+            if bucket in _filters:
+                # Keep visitors recorded locally while the merge ran
+                f.merge(bytes(_filters[bucket].bits))
+            _filters[bucket] = f
+        _merged["at"] = time.monotonic()
+    _stats["merges"] += 1
+    return True
+
+def sweep_visitor_filters():
+    """Delete buckets that have left the window (run on a schedule)."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM visitor_filters WHERE bucket < %s", (_window().start,))
+        return cur.rowcount
+
+def _take_pending():
+    with _lock:
+        n = _pending["n"]
+        _pending["n"] = 0
+    return n
+
+def _flush_failed(n):
+    with _lock:
+        _pending["n"] += n
+    _stats["failed_flushes"] += 1
+
+def _flushed(n, row):
+    if n:
+        _stats["flushes"] += 1
+        _stats["flushed_hits"] += n
+    else:
+        _stats["reads"] += 1
+    if row:
+        _counts["hits"] = {
+            "total": row[0],
+            "daily": row[1],
+            "monthly": row[2],
+            "last_daily_reset": row[3],
+            "last_monthly_reset": row[4],
+        }
+    _counts["read_at"] = time.monotonic()
+    return _counts["hits"]
+
+def flush_hits():
+    """Write buffered visits in one statement and refresh the counters
+    (just read them when nothing is buffered). The flush commits on its own
+    rather than with the request, so the visits are either written or
+    buffered again for the next flush."""
+    n = _take_pending()
+    try:
+        with db_connection(scoped=False) as conn, conn.cursor() as cur:
+            if n:
+                cur.execute(FLUSH_HITS_SQL, {"n": n})
+            else:
+                cur.execute(READ_HITS_SQL)
+            row = cur.fetchone()
+    except Exception:
+        _flush_failed(n)
+        return None
+    return _flushed(n, row)
+
+async def flush_hits_async():
+    n = _take_pending()
+    try:
+        async with acquire() as conn:
+            if n:
+                row = await conn.fetchrow(pg(FLUSH_HITS_SQL), n)
+            else:
+                row = await conn.fetchrow(READ_HITS_SQL)
+    except Exception:
+        _flush_failed(n)
+        return None
+    return _flushed(n, row)
 
-    # Reset daily hits if the last reset was not today
-    if hits["last_daily_reset"] != today:
-        hits["daily"] = 0
-        hits["last_daily_reset"] = today
+def _flush_on_exit():
+    flush_hits()
+    if _dirty:
+        merge_visitor_filters()
 
-    # Reset monthly hits if the last reset was not this month
-    if hits["last_monthly_reset"] != first_of_month:
-        hits["monthly"] = 0
-        hits["last_monthly_reset"] = first_of_month
+# Best effort only: serverless platforms freeze and reclaim instances
+# without running it, hence the timer below
+atexit.register(_flush_on_exit)
 
-    # Skip counting for bots (no IP provided) or recent visitors
-    if not ip or is_recent_visitor(ip):
-        return hits
+def _flush_stale():
+    with _lock:
+        due = _pending["n"] and time.monotonic() - _pending["since"] >= HIT_FLUSH_INTERVAL
+    if due:
+        flush_hits()
 
-    record_visitor(ip)
+def _schedule_flush():
+    """Flush HIT_FLUSH_INTERVAL after the first buffered visit even if no
+    other visit comes to do it. A frozen instance runs it when it thaws."""
+    timer = threading.Timer(HIT_FLUSH_INTERVAL, _flush_stale)
+    timer.daemon = True
+    timer.start()
 
-    hits["total"] += 1
-    hits["daily"] += 1
-    hits["monthly"] += 1
+def _count_visit(ip):
+    if ip and record_visitor(ip):
+        with _lock:
+            first = _pending["n"] == 0
+            if first:
+                _pending["since"] = time.monotonic()
+            _pending["n"] += 1
+        if first and HIT_FLUSH_INTERVAL > 0:
+            _schedule_flush()
 
-    save_hits(hits)
+def _flush_due(now):
+    with _lock:
+        pending = _pending["n"]
+        return (
+            pending >= HIT_FLUSH_BATCH
+            or (pending and now - _pending["since"] >= HIT_FLUSH_INTERVAL)
+            or _counts["hits"] is None
+            or now - _counts["read_at"] >= HIT_FLUSH_INTERVAL
+        )
+
+def _visible_counts():
+    hits = dict(_counts["hits"] or {"total": 0, "daily": 0, "monthly": 0,
+                                    "last_daily_reset": None, "last_monthly_reset": None})
+    pending = _pending["n"]
+    hits["total"] += pending
+    hits["daily"] += pending
+    hits["monthly"] += pending
     return hits
+
+def update_hit_counts(ip=None):
+    """Count a visit (bots pass no ip) and return the counters as this
+    instance sees them: the last flushed values plus its buffered visits."""
+    _count_visit(ip)
+    now = time.monotonic()
+    if _flush_due(now):
+        flush_hits()
+    if now - _merged["at"] >= VISITOR_MERGE_INTERVAL:
+        merge_visitor_filters()
+    return _visible_counts()
+
+async def update_hit_counts_async(ip=None):
+    """update_hit_counts() for the ASGI app: the flush goes over asyncpg;
+    the periodic filter merge (row locks, rare) runs in a worker thread."""
+    _count_visit(ip)
+    now = time.monotonic()
+    if _flush_due(now):
+        await flush_hits_async()
+    if now - _merged["at"] >= VISITOR_MERGE_INTERVAL:
+        _merged["at"] = now  # one merge at a time per instance
+        await asyncio.to_thread(merge_visitor_filters)
+    return _visible_counts()
+
+def hit_counter_stats():
+    stats = dict(_stats)
+    stats["pending"] = _pending["n"]
+    stats["visitor_buckets"] = len(_filters)
+    return stats
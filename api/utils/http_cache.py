@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import zlib
+from dataclasses import dataclass
+
+import requests
+
+from api.utils.db import db_connection
+
+@dataclass
+class FetchResult:
+    url: str
+    content: bytes
+    content_hash: str
+    changed: bool  # False when the server answered 304 or sent identical bytes
+
+# url -> {"etag", "last_modified", "content_hash", "content"}; survives
+# between invocations on a warm instance, backed by http_validators
+_entries = {}
+
+_stats = {
+    "requests": 0,
+    "not_modified": 0,  # 304 responses
+    "unchanged": 0,     # 200 with the same content hash as last time
+    "changed": 0,
+    "bytes_received": 0,  # bodies of 200 responses
+    "bytes_saved": 0,     # stored bodies not downloaded again thanks to a 304
+}
+
+def _load(url):
+    try:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT etag, last_modified, content_hash, body FROM http_validators WHERE url = %s",
+                (url,),
+            )
+            row = cur.fetchone()
+    except Exception:
+        return None
+    if not row:
+        return None
+    return {
+        "etag": row[0],
+        "last_modified": row[1],
+        "content_hash": row[2],
+        "content": zlib.decompress(bytes(row[3])),
+    }
+
+def _store(url, entry):
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO http_validators (url, etag, last_modified, content_hash, body, changed_at)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = EXCLUDED.etag,
+                    last_modified = EXCLUDED.last_modified,
+                    changed_at = CASE WHEN http_validators.content_hash = EXCLUDED.content_hash
+                                      THEN http_validators.changed_at ELSE NOW() END,
+                    content_hash = EXCLUDED.content_hash,
+                    body = EXCLUDED.body
+                """,
+                (url, entry["etag"], entry["last_modified"], entry["content_hash"],
+                 zlib.compress(entry["content"])),
+            )
+    except Exception:
+        pass
+
+def _validator_headers(entry):
+    headers = {}
+    if entry:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def _not_modified(url, entry):
+    _stats["not_modified"] += 1
+    _stats["bytes_saved"] += len(entry["content"])
+    _entries[url] = entry
+    return FetchResult(url, entry["content"], entry["content_hash"], changed=False)
+
+def _accept(url, entry, content, headers):
+    """Remember a 200 response. Returns the FetchResult and the entry to
+    persist, or None when http_validators already has it."""
+    content_hash = hashlib.sha256(content).hexdigest()
+    _stats["bytes_received"] += len(content)
+    new_entry = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_hash": content_hash,
+        "content": content,
+    }
+    changed = not entry or entry["content_hash"] != content_hash
+    _stats["changed" if changed else "unchanged"] += 1
+    _entries[url] = new_entry
+    stale = changed or entry["etag"] != new_entry["etag"] or entry["last_modified"] != new_entry["last_modified"]
+    return FetchResult(url, content, content_hash, changed=changed), new_entry if stale else None
+
+def conditional_get(url, timeout=30):
+    """GET `url` with If-None-Match/If-Modified-Since from the last response.
+
+    A 304 or an identical body returns the stored content with
+    changed=False, letting callers skip parsing. Raises on HTTP errors."""
+    entry = _entries.get(url) or _load(url)
+    _stats["requests"] += 1
+    resp = requests.get(url, headers=_validator_headers(entry), timeout=timeout)
+    if resp.status_code == 304 and entry:
+        return _not_modified(url, entry)
+    resp.raise_for_status()
+
+    result, store = _accept(url, entry, resp.content, resp.headers)
+    if store:
+        _store(url, store)
+    return result
+
+async def conditional_get_async(url, client, timeout=30):
+    """conditional_get() on an httpx.AsyncClient, sharing its validators.
+    Loading and persisting them (rare once warm) runs in a worker thread."""
+    entry = _entries.get(url) or await asyncio.to_thread(_load, url)
+    _stats["requests"] += 1
+    resp = await client.get(url, headers=_validator_headers(entry), timeout=timeout)
+    if resp.status_code == 304 and entry:
+        return _not_modified(url, entry)
+    resp.raise_for_status()
+
+    result, store = _accept(url, entry, resp.content, resp.headers)
+    if store:
+        await asyncio.to_thread(_store, url, store)
+    return result
+
+def fetch_stats():
+    """Counters for the validator cache; hits are 304s plus unchanged bodies."""
+    stats = dict(_stats)
+    stats["hits"] = stats["not_modified"] + stats["unchanged"]
+    stats["misses"] = stats["changed"]
+    return stats
@@ -0,0 +1,190 @@
+import os
+import time
+
+from api.utils.db import db_connection
+from api.utils.notify import send_bulk
+from api.utils.subscription import mark_sent
+
+NOTIFY_CHUNK_SIZE = int(os.getenv("NOTIFY_CHUNK_SIZE", "500"))
+# Seconds check_bulletin may run (maxDuration in vercel.json); keep in sync
+FUNCTION_MAX_DURATION = float(os.getenv("FUNCTION_MAX_DURATION", "60"))
+# Seconds of that left over for the scrape before sending and for the last
+# batch, the bookkeeping and the response after the budget runs out
+NOTIFY_SAFETY_MARGIN = float(os.getenv("NOTIFY_SAFETY_MARGIN", "20"))
+# Seconds of sending per invocation
+NOTIFY_TIME_BUDGET = float(
+    os.getenv("NOTIFY_TIME_BUDGET", max(FUNCTION_MAX_DURATION - NOTIFY_SAFETY_MARGIN, 1.0))
+)
+# A crashed invocation's lease expires after this long, letting another resume
+NOTIFY_LEASE_SECONDS = int(os.getenv("NOTIFY_LEASE_SECONDS", "120"))
+
+JOB_COLUMNS = (
+    "id, bulletin_month, status, total, sent, failed, chunks, busy_seconds, "
+    "created_at, updated_at, finished_at"
+)
+
+def _job_dict(row):
+    job = {
+        "id": row[0],
+        "bulletin_month": row[1],
+        "status": row[2],
+        "total": row[3],
+        "sent": row[4],
+        "failed": row[5],
+        "chunks": row[6],
+        "busy_seconds": round(row[7], 2),
+        "created_at": row[8].isoformat() if row[8] else None,
+        "updated_at": row[9].isoformat() if row[9] else None,
+        "finished_at": row[10].isoformat() if row[10] else None,
+    }
+    job["processed"] = job["sent"] + job["failed"]
+    job["remaining"] = max(job["total"] - job["processed"], 0)
+    job["emails_per_second"] = round(job["sent"] / row[7], 2) if row[7] else 0.0
+    return job
+
+def create_job(bulletin_month, subject, body):
+    """Create the notification job for a bulletin month (idempotent) and
+    return its id."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO notification_jobs (bulletin_month, subject, body, total)
+            SELECT %s, %s, %s, COUNT(*) FROM subscriptions
+            WHERE last_sent_month IS DISTINCT FROM %s
+            ON CONFLICT (bulletin_month) DO NOTHING
+            RETURNING id
+            """,
+            (bulletin_month, subject, body, bulletin_month),
+        )
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("SELECT id FROM notification_jobs WHERE bulletin_month = %s", (bulletin_month,))
+            row = cur.fetchone()
+    return row[0]
+
+def get_job(job_id):
+    with db_connection(readonly=True) as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT {JOB_COLUMNS} FROM notification_jobs WHERE id = %s", (job_id,))
+        row = cur.fetchone()
+    return _job_dict(row) if row else None
+
+def next_unfinished_job():
+    """Id of the oldest job that still has recipients left, or None."""
+    with db_connection(readonly=True) as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT id FROM notification_jobs WHERE status <> 'done' ORDER BY created_at LIMIT 1"
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
+
+def _claim(job_id):
+    """Take the job's lease so concurrent invocations never send the same chunk."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE notification_jobs
+            SET status = 'running',
+                lease_until = NOW() + make_interval(secs => %s),
+                updated_at = NOW()
+            WHERE id = %s AND status <> 'done'
+              AND (lease_until IS NULL OR lease_until < NOW())
+            RETURNING bulletin_month, subject, body, cursor_email
+            """,
+            (NOTIFY_LEASE_SECONDS, job_id),
+        )
+        return cur.fetchone()
+
+def _next_chunk(cursor_email, bulletin_month):
+    with db_connection(readonly=True) as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT email FROM subscriptions
+            WHERE email > %s AND last_sent_month IS DISTINCT FROM %s
+            ORDER BY email LIMIT %s
+            """,
+            (cursor_email, bulletin_month, NOTIFY_CHUNK_SIZE),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+def _advance(job_id, cursor_email, sent, failed, busy_seconds, done):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE notification_jobs
+            SET cursor_email = %s,
+                sent = sent + %s,
+                failed = failed + %s,
+                chunks = chunks + 1,
+                busy_seconds = busy_seconds + %s,
+                status = CASE WHEN %s THEN 'done' ELSE status END,
+                finished_at = CASE WHEN %s THEN NOW() ELSE finished_at END,
+                lease_until = CASE WHEN %s THEN NULL
+                                   ELSE NOW() + make_interval(secs => %s) END,
+                updated_at = NOW()
+            WHERE id = %s
+            """,
+            (cursor_email, sent, failed, busy_seconds, done, done, done, NOTIFY_LEASE_SECONDS, job_id),
+        )
+
+def _renew(job_id):
+    """Push the lease out again while a chunk is still sending."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE notification_jobs SET lease_until = NOW() + make_interval(secs => %s), "
+            "updated_at = NOW() WHERE id = %s AND status <> 'done'",
+            (NOTIFY_LEASE_SECONDS, job_id),
+        )
+
+def _recorded(job_id, batch, bulletin_month):
+    mark_sent(batch, bulletin_month)
+    _renew(job_id)
+
+def _release(job_id):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE notification_jobs SET lease_until = NULL WHERE id = %s", (job_id,))
+
+def run_job(job_id, time_budget=None):
+    """Send chunks of the job until it finishes or the time budget is spent.
+
+    Recipients are recorded with mark_sent as each send batch completes and
+    are excluded from later chunks, and each batch renews the lease, so an
+    invocation killed mid-chunk only risks resending its last unrecorded
+    batch. No send starts after the budget; the cursor only moves past
+    recipients that were attempted. Returns the job's progress."""
+    budget = NOTIFY_TIME_BUDGET if time_budget is None else time_budget
+    claimed = _claim(job_id)
+    if claimed is None:
+        job = get_job(job_id)
+        if job and job["status"] != "done":
+            job["note"] = "another invocation holds the lease"
+        return job
+
+    bulletin_month, subject, body, cursor_email = claimed
+    deadline = time.monotonic() + budget
+    done = False
+    try:
+        while time.monotonic() < deadline:
+            chunk = _next_chunk(cursor_email, bulletin_month)
+            if not chunk:
+                _advance(job_id, cursor_email, 0, 0, 0.0, True)
+                done = True
+                break
+            outcome = send_bulk(
+                chunk, subject, body, bulletin_month,
+                on_batch_sent=lambda batch: _recorded(job_id, batch, bulletin_month),
+                deadline=deadline,
+            )
+            attempted = len(chunk) - len(outcome["unsent"])
+            if attempted:
+                cursor_email = chunk[attempted - 1]
+            done = not outcome["unsent"] and len(chunk) < NOTIFY_CHUNK_SIZE
+            _advance(
+                job_id, cursor_email, len(outcome["sent"]), len(outcome["failed"]),
+                outcome["elapsed"], done,
+            )
+            if done:
+                break
+    finally:
+        if not done:
+            _release(job_id)
+    return get_job(job_id)
@@ -0,0 +1,147 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.utils.email import SMTP_USER, EmailTemplate, open_smtp_session
+from api.utils.ratelimit import TokenBucket
+
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+# Messages sent over one authenticated SMTP session before reconnecting
+SMTP_MESSAGES_PER_SESSION = int(os.getenv("SMTP_MESSAGES_PER_SESSION", "100"))
+# last_sent_month is written once per this many successful sends
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "50"))
+
+# Messages/sec through our relay, and per recipient mail provider (domain)
+SMTP_RATE_LIMIT = float(os.getenv("SMTP_RATE_LIMIT", "10"))
+PROVIDER_RATE_LIMITS = {
+    "gmail.com": 5,
+    "googlemail.com": 5,
+    "outlook.com": 3,
+    "hotmail.com": 3,
+    "live.com": 3,
+    "yahoo.com": 3,
+}
+DEFAULT_PROVIDER_RATE_LIMIT = float(os.getenv("PROVIDER_RATE_LIMIT", "5"))
+
+_relay_bucket = TokenBucket(SMTP_RATE_LIMIT)
+_provider_buckets = {}
+_provider_lock = threading.Lock()
+
+def _provider_bucket(email):
+    domain = email.rsplit("@", 1)[-1].lower()
+    with _provider_lock:
+        bucket = _provider_buckets.get(domain)
+        if bucket is None:
+            bucket = TokenBucket(PROVIDER_RATE_LIMITS.get(domain, DEFAULT_PROVIDER_RATE_LIMIT))
+            _provider_buckets[domain] = bucket
+    return bucket
+
+def _close(session):
+    if session is None:
+        return
+    try:
+        session.quit()
+    except Exception:
+        session.close()
+
+def _worker(work, results, template, deadline=None):
+    """Drain the work queue over one reused SMTP session, reconnecting every
+    SMTP_MESSAGES_PER_SESSION messages or when the server drops us. Stops
+    taking work once `deadline` (time.monotonic()) has passed, and posts
+    None to results when done."""
+    session = None
+    sent_in_session = 0
+    try:
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            try:
+                email = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                message = template.render(email)
+                _provider_bucket(email).acquire()
+                _relay_bucket.acquire()
+                if session is None or sent_in_session >= SMTP_MESSAGES_PER_SESSION:
+                    _close(session)
+                    session = None
+                    session = open_smtp_session()
+                    sent_in_session = 0
+                try:
+                    session.sendmail(SMTP_USER, email, message)
+                except smtplib.SMTPServerDisconnected:
+                    session = open_smtp_session()
+                    sent_in_session = 0
+                    session.sendmail(SMTP_USER, email, message)
+                sent_in_session += 1
+                results.put((email, True))
+            except smtplib.SMTPRecipientsRefused as e:
+                # The session is still usable; only this recipient failed
+                print(f"Failed to send email to {email}: {e}")
+                results.put((email, False))
+            except Exception as e:
+                print(f"Failed to send email to {email}: {e}")
+                _close(session)
+                session = None
+                results.put((email, False))
+    finally:
+        _close(session)
+        results.put(None)
+
+def send_bulk(emails, subject, body, bulletin_month, on_batch_sent=None, workers=None, deadline=None):
+    """Send the bulletin to many recipients over a bounded pool of SMTP
+    sessions. Successful recipients are handed to on_batch_sent in batches of
+    NOTIFY_BATCH_SIZE so the caller can record them with one write per batch.
+
+    Recipients are taken in order and none is started after `deadline`
+    (time.monotonic()); those left over come back as "unsent", so sent and
+    failed together are always a prefix of `emails`.
+    Returns {"sent": [...], "failed": [...], "unsent": [...], "elapsed": seconds}."""
+    started = time.monotonic()
+    emails = list(emails)
+    sent, failed = [], []
+    if not emails:
+        return {"sent": sent, "failed": failed, "unsent": [], "elapsed": 0.0}
+
+    # Render the shared body and MIME skeleton once for every recipient
+    template = EmailTemplate(subject, body, bulletin_month)
+    work = queue.Queue()
+    for email in emails:
+        work.put(email)
+    results = queue.Queue()
+    n_workers = max(1, min(workers or NOTIFY_WORKERS, len(emails)))
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for _ in range(n_workers):
+            pool.submit(_worker, work, results, template, deadline)
+        # One result per email taken, then None from each worker
+        finished = 0
+        while finished < n_workers:
+            item = results.get()
+            if item is None:
+                finished += 1
+                continue
+            email, ok = item
+            if not ok:
+                failed.append(email)
+                continue
+            sent.append(email)
+            batch.append(email)
+            if on_batch_sent and len(batch) >= NOTIFY_BATCH_SIZE:
+                on_batch_sent(batch)
+                batch = []
+    if on_batch_sent and batch:
+        on_batch_sent(batch)
+
+    unsent = []
+    while not work.empty():
+        unsent.append(work.get_nowait())
+
+    elapsed = time.monotonic() - started
+    print(f"Bulk send: {len(sent)} sent, {len(failed)} failed, {len(unsent)} unsent in {elapsed:.1f}s")
+    return {"sent": sent, "failed": failed, "unsent": unsent, "elapsed": elapsed}
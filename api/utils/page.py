@@ -0,0 +1,70 @@
+from dataclasses import dataclass, field
+
+from api.utils.db import (
+    cached_bulletin_stamp,
+    get_cached_bulletin_with_history,
+    get_cached_bulletin_with_history_async,
+    memoized_bulletin,
+)
+
+@dataclass
+class IndexPageData:
+    """Everything the "/" route reads from the database. Visit counts and the
+    subscriber count are per-visitor and come from /api/stats instead, so
+    the page itself can be cached."""
+    cache: dict | None = None
+    latest_history: list = field(default_factory=list)
+
+# Latest history per (category, country, n), valid while the bulletin_cache
+# stamp it was read under is current: history only changes with the bulletin.
+_latest = {}
+
+def _memoized_latest(key):
+    stamp = cached_bulletin_stamp()
+    memo = _latest.get(key)
+    if memo is not None and stamp is not None and memo[0] == stamp:
+        return memo[1]
+    return None
+
+def _remember_latest(key, latest):
+    stamp = cached_bulletin_stamp()
+    if stamp is not None:
+        _latest[key] = (stamp, latest)
+
+def _from_memory(key):
+    latest = _memoized_latest(key)
+    cache = memoized_bulletin() if latest is not None else None
+    if cache is None:
+        return None
+    return IndexPageData(cache=cache, latest_history=latest)
+
+def _loaded(key, cache, latest):
+    # Both came from one statement, so the history matches the stamp the
+    # bulletin copy now carries
+    if latest is None:
+        latest = []
+    else:
+        _remember_latest(key, latest)
+    return IndexPageData(cache=cache, latest_history=latest)
+
+def load_index_page(category='2nd', country='all_other', history_n=2):
+    """Load the bulletin cache and latest history. A warm instance serves
+    both from memory without touching Postgres; otherwise one statement
+    revalidates the bulletin and reads the history."""
+    key = (category, country, history_n)
+    page = _from_memory(key)
+    if page is not None:
+        return page
+    cache, latest = get_cached_bulletin_with_history(history_n, category=category, country=country)
+    return _loaded(key, cache, latest)
+
+async def load_index_page_async(category='2nd', country='all_other', history_n=2):
+    """load_index_page() for the ASGI app."""
+    key = (category, country, history_n)
+    page = _from_memory(key)
+    if page is not None:
+        return page
+    cache, latest = await get_cached_bulletin_with_history_async(
+        history_n, category=category, country=country
+    )
+    return _loaded(key, cache, latest)
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+# status values stored in bulletin_history.*_status
+CURRENT = 'C'
+UNAVAILABLE = 'U'
+DATED = 'D'
+
+def parse_priority_date(date_str):
+    """Parse a priority date string like '01JAN22' to a date object."""
+    if not date_str or date_str.strip().upper() in ('C', 'U', ''):
+        return None
+    date_str = date_str.strip()
+    for fmt in ("%d%b%y", "%d%b%Y"):
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def normalize_priority_date(date_str, bulletin_month):
+    """Split a bulletin cell into (status, priority_date, days_from_current).
+
+    C resolves to the 15th of the bulletin month (0 days), U has no date, and
+    blank or unparseable cells are (None, None, None)."""
+    value = (date_str or '').strip().upper()
+    mid_month = bulletin_month.replace(day=15)
+    if value == CURRENT:
+        return CURRENT, mid_month, 0
+    if value == UNAVAILABLE:
+        return UNAVAILABLE, None, None
+    pd = parse_priority_date(value)
+    if pd is None:
+        return None, None, None
+    return DATED, pd, (pd - mid_month).days
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from api.utils.adb import get_pool
+from api.utils.bulletin import BulletinSnapshot, run_check, run_check_async
+from api.utils.db import (
+    get_cached_bulletin,
+    get_cached_bulletin_async,
+    get_db_connection,
+    save_cached_bulletin,
+    save_cached_bulletin_async,
+)
+
+# Serve the last scraped bulletin at once and refresh it in the background
+# instead of making the visitor wait for travel.state.gov
+STALE_WHILE_REVALIDATE = os.getenv("BULLETIN_STALE_WHILE_REVALIDATE", "1") != "0"
+# Seconds to wait on a scrape already running here or on another instance
+REFRESH_WAIT = float(os.getenv("BULLETIN_REFRESH_WAIT", "20"))
+# A stale copy younger than this is served without starting another refresh,
+# so a database outage does not turn every page view into a scrape
+REFRESH_MIN_INTERVAL = float(os.getenv("BULLETIN_REFRESH_MIN_INTERVAL", "60"))
+# pg advisory lock held by whichever instance is scraping
+REFRESH_LOCK_ID = 5_661_001
+
+_lock = threading.Lock()
+_inflight = None  # Future of the scrape running in this process, if any
+_async_inflight = None  # asyncio.Task of the ASGI app's scrape, if any
+_last = None      # cache entry of the last successful scrape
+_last_at = 0.0
+_stats = {
+    "scrapes": 0,          # run_check() calls made from page views
+    "coalesced": 0,        # requests that joined a scrape already in flight
+    "stale_served": 0,     # requests answered from _last during a refresh
+    "remote_waits": 0,     # scrapes skipped because another instance held the lock
+    "failures": 0,
+}
+
+def _wait_for_other_instance():
+    deadline = time.monotonic() + REFRESH_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        # Past the in-process copy, which would hide the other instance's save
+        cache = get_cached_bulletin(fresh=True)
+        if cache and cache["snapshot"]:
+            return cache
+    return None
+
+def _scrape():
+    """Scrape and save the bulletin, unless another instance is already doing
+    it, in which case wait for its result to land in bulletin_cache."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (REFRESH_LOCK_ID,))
+            leader = cur.fetchone()[0]
+    except Exception:
+        leader = True  # no database: nothing to coordinate with
+    try:
+        if not leader:
+            _stats["remote_waits"] += 1
+            found = _wait_for_other_instance()
+            if found:
+                return found
+        _stats["scrapes"] += 1
+        snapshot = run_check()
+        if snapshot.bulletin_month:
+            save_cached_bulletin(snapshot.stored(), snapshot.bulletin_month, snapshot.table_hash)
+        else:
+            _stats["failures"] += 1
+        return snapshot.cache_entry()
+    finally:
+        if conn is not None:
+            conn.close()  # releases the advisory lock
+
+def _fly(future):
+    global _inflight, _last, _last_at
+    try:
+        value = _scrape()
+        if value["bulletin_month"]:
+            _last = value
+            _last_at = time.monotonic()
+        future.set_result(value)
+    except Exception as e:
+        _stats["failures"] += 1
+        future.set_exception(e)
+    finally:
+        with _lock:
+            _inflight = None
+
+def refresh_bulletin():
+    """Bulletin entry, shaped like get_cached_bulletin()'s, for a page view
+    that found bulletin_cache empty or unreachable. Concurrent callers share one scrape; with a last
+    known bulletin in memory they get it immediately while it refreshes.
+
+    The background refresh is best effort: a frozen serverless instance
+    resumes it on the next invocation, and later callers simply join it."""
+    global _inflight
+    if STALE_WHILE_REVALIDATE and _last is not None and time.monotonic() - _last_at < REFRESH_MIN_INTERVAL:
+        _stats["stale_served"] += 1
+        return _last
+
+    with _lock:
+        future = _inflight
+        leader = future is None
+        if leader:
+            future = _inflight = Future()
+        else:
+            _stats["coalesced"] += 1
+
+    if STALE_WHILE_REVALIDATE and _last is not None:
+        if leader:
+            threading.Thread(target=_fly, args=(future,), daemon=True).start()
+        _stats["stale_served"] += 1
+        return _last
+
+    if leader:
+        _fly(future)
+    try:
+        return future.result(timeout=REFRESH_WAIT)
+    except Exception as e:
+        return BulletinSnapshot.failed(e).cache_entry()
+
+async def _wait_for_other_instance_async():
+    deadline = time.monotonic() + REFRESH_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+        cache = await get_cached_bulletin_async(fresh=True)
+        if cache and cache["snapshot"]:
+            return cache
+    return None
+
+async def _scrape_async():
+    """_scrape() for the ASGI app. The advisory lock lives on a pooled
+    connection, so it is released explicitly before the connection goes back."""
+    db_pool = conn = None
+    try:
+        db_pool = await get_pool()
+        conn = await db_pool.acquire()
+        leader = await conn.fetchval("SELECT pg_try_advisory_lock($1)", REFRESH_LOCK_ID)
+    except Exception:
+        leader = True
+    try:
+        if not leader:
+            _stats["remote_waits"] += 1
+            found = await _wait_for_other_instance_async()
+            if found:
+                return found
+        _stats["scrapes"] += 1
+        snapshot = await run_check_async()
+        if snapshot.bulletin_month:
+            await save_cached_bulletin_async(snapshot.stored(), snapshot.bulletin_month, snapshot.table_hash)
+        else:
+            _stats["failures"] += 1
+        return snapshot.cache_entry()
+    finally:
+        if conn is not None:
+            try:
+                if leader:
+                    await conn.execute("SELECT pg_advisory_unlock($1)", REFRESH_LOCK_ID)
+            finally:
+                await db_pool.release(conn)
+
+async def _fly_async():
+    global _async_inflight, _last, _last_at
+    try:
+        value = await _scrape_async()
+        if value["bulletin_month"]:
+            _last = value
+            _last_at = time.monotonic()
+        return value
+    except Exception:
+        _stats["failures"] += 1
+        raise
+    finally:
+        _async_inflight = None
+
+async def refresh_bulletin_async():
+    """refresh_bulletin() for the ASGI app: callers on the event loop share
+    one scrape task, and it survives a caller giving up after REFRESH_WAIT."""
+    global _async_inflight
+    if STALE_WHILE_REVALIDATE and _last is not None and time.monotonic() - _last_at < REFRESH_MIN_INTERVAL:
+        _stats["stale_served"] += 1
+        return _last
+
+    task = _async_inflight
+    if task is None:
+        task = _async_inflight = asyncio.ensure_future(_fly_async())
+    else:
+        _stats["coalesced"] += 1
+
+    if STALE_WHILE_REVALIDATE and _last is not None:
+        _stats["stale_served"] += 1
+        return _last
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), REFRESH_WAIT)
+    except Exception as e:
+        return BulletinSnapshot.failed(e).cache_entry()
+
+def refresh_stats():
+    stats = dict(_stats)
+    stats["in_flight"] = _inflight is not None or _async_inflight is not None
+    return stats
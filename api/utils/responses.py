@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import json
+import os
+
+from flask import Response, request
+
+try:
+    import brotli  # in requirements.txt
+except ImportError:  # installs without it serve gzip only
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Shared-cache lifetime for pages whose content only changes with the
+# bulletin. Browsers always revalidate (max-age=0); the edge serves from its
+# cache for PAGE_S_MAXAGE seconds, then serves stale while it refetches.
+PAGE_S_MAXAGE = int(os.getenv("PAGE_S_MAXAGE", "300"))
+PAGE_STALE_WHILE_REVALIDATE = int(os.getenv("PAGE_STALE_WHILE_REVALIDATE", "86400"))
+CDN_CACHE_CONTROL = (
+    f"public, max-age=0, s-maxage={PAGE_S_MAXAGE}, "
+    f"stale-while-revalidate={PAGE_STALE_WHILE_REVALIDATE}"
+)
+NO_STORE = "private, no-store"
+
+# Mixed into page validators so a deploy (new templates) invalidates them
+RELEASE = os.getenv("VERCEL_GIT_COMMIT_SHA", "")
+
+def page_etag(*parts):
+    """Strong ETag for a page whose content is fully determined by `parts`."""
+    seed = "|".join(str(p) for p in (RELEASE, *parts))
+    return hashlib.sha256(seed.encode()).hexdigest()[:32]
+
+def not_modified(etags, last_modified=None, req=None):
+    """Evaluate If-None-Match (which wins when present) or If-Modified-Since
+    on `req`, Flask's current request by default."""
+    req = request if req is None else req
+    if req.method not in ("GET", "HEAD"):
+        return False
+    if req.if_none_match:
+        return req.if_none_match.star_tag or any(req.if_none_match.contains(e) for e in etags)
+    if last_modified and req.if_modified_since:
+        return req.if_modified_since >= last_modified.replace(microsecond=0)
+    return False
+
+def page_response(etag, body, last_modified=None, cache_control=CDN_CACHE_CONTROL, response_class=Response):
+    """Response for a rendered page (or None, when a 304 means it never had
+    to be rendered) with its validators and shared-cache headers. With no
+    etag the response is sent uncached. The ASGI app passes its own
+    response class."""
+    if etag is None:
+        resp = response_class(body, mimetype='text/html')
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    if body is None:
+        resp = response_class(status=304)
+    else:
+        resp = response_class(body, mimetype='text/html')
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+def cached_page(etag, render, last_modified=None, cache_control=CDN_CACHE_CONTROL):
+    """Answer a conditional GET with 304 without rendering, otherwise call
+    render() and attach the validators and shared-cache headers. With no
+    etag the response is sent uncached."""
+    fresh = etag is not None and not_modified([etag], last_modified)
+    return page_response(etag, None if fresh else render(), last_modified, cache_control)
+
+class EncodedBody:
+    """A JSON document serialized and compressed once, with a strong ETag per
+    representation. Build it when the data changes, not per request. Keys are
+    sorted so every instance produces the same bytes (and ETag) for the same
+    data, whether it came from memory or a JSONB column."""
+
+    def __init__(self, obj):
+        self.identity = json.dumps(obj, separators=(',', ':'), sort_keys=True).encode()
+        self.digest = hashlib.sha256(self.identity).hexdigest()[:32]
+        self.bodies = {
+            None: self.identity,
+            'gzip': gzip.compress(self.identity, compresslevel=GZIP_LEVEL, mtime=0),
+        }
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(self.identity, quality=BROTLI_QUALITY)
+
+    def etag(self, encoding):
+        # Compressed bytes differ from the identity bytes, so each
+        # representation gets its own strong validator
+        return f'{self.digest}-{encoding}' if encoding else self.digest
+
+    def etags(self):
+        return {self.etag(encoding) for encoding in self.bodies}
+
+    def negotiate(self, accept_encodings):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and accept_encodings[encoding]:
+                return encoding
+        return None
+
+def json_response(body, cache_control=CDN_CACHE_CONTROL, req=None, response_class=Response, cacheable=True):
+    """Serve an EncodedBody for the current request: the best encoding the
+    client accepts, or 304 when If-None-Match holds any of its ETags. When
+    not cacheable (a fallback, not a stored version) it goes out with no
+    validator and NO_STORE."""
+    req = request if req is None else req
+    encoding = body.negotiate(req.accept_encodings)
+    if not cacheable:
+        resp = response_class(body.bodies[encoding], mimetype='application/json')
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+        resp.headers['Cache-Control'] = NO_STORE
+        resp.vary.add('Accept-Encoding')
+        return resp
+    if not_modified(body.etags(), req=req):
+        resp = response_class(status=304)
+    else:
+        resp = response_class(body.bodies[encoding], mimetype='application/json')
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(body.etag(encoding))
+    resp.headers['Cache-Control'] = cache_control
+    resp.vary.add('Accept-Encoding')
+    return resp
@@ -1,17 +1,23 @@
-from api.utils.db import get_db_connection
+import os
+import time
+
+from api.utils.adb import acquire
+from api.utils.db import db_connection
 from api.utils.email import send_email
 
+SUBSCRIBER_COUNT_TTL = float(os.getenv("SUBSCRIBER_COUNT_TTL", "60"))
+
+# In-process cache in front of subscriber_stats (see migrations/001_subscriber_stats.sql)
+_count_cache = {"value": None, "expires": 0.0}
+
 def load_subscriptions():
-    conn = get_db_connection()
-    with conn.cursor() as cur:
+    with db_connection(readonly=True) as conn, conn.cursor() as cur:
         cur.execute("SELECT email, last_sent_month FROM subscriptions")
         subscriptions = [{"email": row[0], "last_sent_month": row[1]} for row in cur.fetchall()]
-    conn.close()
     return subscriptions
 
 def save_subscriptions(data):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
+    with db_connection() as conn, conn.cursor() as cur:
         for email in data["emails"]:
             # Insert or update the subscription with the correct last_sent_month
             cur.execute(
@@ -23,40 +29,81 @@ def save_subscriptions(data):
                 """,
                 (email, data["last_sent_month"]),
             )
-    conn.commit()
-    conn.close()
+    invalidate_subscriber_count()
+
+def mark_sent(emails, last_sent_month):
+    """Record last_sent_month for a batch of existing subscribers in one statement."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE subscriptions SET last_sent_month = %s WHERE email = ANY(%s)",
+            (last_sent_month, list(emails)),
+        )
+
+def cache_subscriber_count(count):
+    _count_cache["value"] = count
+    _count_cache["expires"] = time.monotonic() + SUBSCRIBER_COUNT_TTL
+
+def invalidate_subscriber_count():
+    _count_cache["value"] = None
+    _count_cache["expires"] = 0.0
+
+SUBSCRIBER_COUNT_SQL = "SELECT subscriber_count FROM subscriber_stats WHERE id = 1"
+# Counter table not migrated yet
+SUBSCRIBER_COUNT_FALLBACK_SQL = "SELECT COUNT(*) FROM subscriptions"
 
 def get_subscriber_count():
-    subs = load_subscriptions()
-    return len(subs)  # Count the number of subscribers
+    if _count_cache["value"] is not None and time.monotonic() < _count_cache["expires"]:
+        return _count_cache["value"]
+    try:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(SUBSCRIBER_COUNT_SQL)
+            row = cur.fetchone()
+    except Exception:
+        row = None
+    if row is None:
+        with db_connection(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(SUBSCRIBER_COUNT_FALLBACK_SQL)
+            row = cur.fetchone()
+    cache_subscriber_count(row[0])
+    return row[0]
+
+async def get_subscriber_count_async():
+    """get_subscriber_count() over asyncpg, sharing its cache."""
+    if _count_cache["value"] is not None and time.monotonic() < _count_cache["expires"]:
+        return _count_cache["value"]
+    async with acquire() as conn:
+        try:
+            count = await conn.fetchval(SUBSCRIBER_COUNT_SQL)
+        except Exception:
+            count = None
+        if count is None:
+            count = await conn.fetchval(SUBSCRIBER_COUNT_FALLBACK_SQL)
+    cache_subscriber_count(count)
+    return count
 
 def unsubscribe_email(email):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
+    with db_connection() as conn, conn.cursor() as cur:
         cur.execute("DELETE FROM subscriptions WHERE email = %s RETURNING email", (email,))
         deleted_email = cur.fetchone()
-    conn.commit()
-    conn.close()
+    invalidate_subscriber_count()
     return deleted_email is not None
 
-def handle_subscription(email, result, bulletin_month, unsubscribe=False):
+def handle_subscription(email, body, bulletin_month, unsubscribe=False):
     subs = load_subscriptions()
 
     if unsubscribe:
         # Check if the email exists in the subscriptions
         for subscription in subs:
             if subscription["email"] == email:
-                conn = get_db_connection()
-                with conn.cursor() as cur:
+                with db_connection() as conn, conn.cursor() as cur:
                     cur.execute("DELETE FROM subscriptions WHERE email = %s", (email,))
-                conn.commit()
-                conn.close()
+                invalidate_subscriber_count()
                 return f"<p>❌ Unsubscribed: {email}</p>"
         return f"<p>ℹ️ Email not found: {email}</p>"
 
     # Always send the email upon resubscription
     subject = f"Visa Bulletin for {bulletin_month}"
-    send_email(email, subject, result, bulletin_month)
+    send_email(email, subject, body, bulletin_month)
 
     # Update the subscription in the database
     save_subscriptions({"emails": [email], "last_sent_month": bulletin_month})
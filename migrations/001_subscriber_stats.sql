@@ -0,0 +1,27 @@
+-- Maintained subscriber counter so the page doesn't COUNT(*) subscriptions.
+-- The trigger keeps it in step with every insert/delete on subscriptions.
+
+CREATE TABLE IF NOT EXISTS subscriber_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    subscriber_count INTEGER NOT NULL
+);
+
+INSERT INTO subscriber_stats (id, subscriber_count)
+SELECT 1, COUNT(*) FROM subscriptions
+ON CONFLICT (id) DO UPDATE SET subscriber_count = EXCLUDED.subscriber_count;
+
+CREATE OR REPLACE FUNCTION bump_subscriber_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE subscriber_stats SET subscriber_count = subscriber_count + 1 WHERE id = 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE subscriber_stats SET subscriber_count = subscriber_count - 1 WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS subscriptions_count ON subscriptions;
+CREATE TRIGGER subscriptions_count
+AFTER INSERT OR DELETE ON subscriptions
+FOR EACH ROW EXECUTE FUNCTION bump_subscriber_count();
@@ -0,0 +1,23 @@
+-- Resumable new-bulletin notification jobs. Each job walks subscriptions in
+-- email order; cursor_email is the last address of the last finished chunk.
+
+CREATE TABLE IF NOT EXISTS notification_jobs (
+    id SERIAL PRIMARY KEY,
+    bulletin_month TEXT NOT NULL UNIQUE,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | running | done
+    cursor_email TEXT NOT NULL DEFAULT '',
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    busy_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    lease_until TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS notification_jobs_unfinished
+    ON notification_jobs (created_at) WHERE status <> 'done';
@@ -0,0 +1,11 @@
+-- HTTP validators for scraped travel.state.gov pages. body keeps the last
+-- response (zlib-compressed) so a 304 can be served on a cold instance.
+
+CREATE TABLE IF NOT EXISTS http_validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT NOT NULL,
+    body BYTEA NOT NULL,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
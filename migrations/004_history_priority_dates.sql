@@ -0,0 +1,64 @@
+-- Normalized priority dates on bulletin_history, computed once at write time
+-- so /history never parses the stored strings.
+--   *_status  C (current), U (unavailable), D (dated); NULL if blank/unparseable
+--   *_pd      resolved priority date; C is the 15th of the bulletin month
+--   *_days    *_pd minus the 15th of the bulletin month (0 for C, NULL for U)
+
+ALTER TABLE bulletin_history
+    ADD COLUMN IF NOT EXISTS fad_status CHAR(1) CHECK (fad_status IN ('C', 'U', 'D')),
+    ADD COLUMN IF NOT EXISTS fad_pd DATE,
+    ADD COLUMN IF NOT EXISTS fad_days INTEGER,
+    ADD COLUMN IF NOT EXISTS filing_status CHAR(1) CHECK (filing_status IN ('C', 'U', 'D')),
+    ADD COLUMN IF NOT EXISTS filing_pd DATE,
+    ADD COLUMN IF NOT EXISTS filing_days INTEGER;
+
+-- Same rules as api.utils.priority_date.parse_priority_date (DDMONYY / DDMONYYYY)
+CREATE FUNCTION pg_temp.parse_priority_date(value TEXT) RETURNS DATE AS $$
+DECLARE
+    v TEXT := upper(btrim(value));
+BEGIN
+    IF v ~ '^\d{1,2}[A-Z]{3}\d{2}$' THEN
+        RETURN to_date(lpad(v, 7, '0'), 'DDMONYY');
+    ELSIF v ~ '^\d{1,2}[A-Z]{3}\d{4}$' THEN
+        RETURN to_date(lpad(v, 9, '0'), 'DDMONYYYY');
+    END IF;
+    RETURN NULL;
+EXCEPTION WHEN OTHERS THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+UPDATE bulletin_history AS h SET
+    fad_status = CASE
+        WHEN upper(btrim(h.final_action_date)) IN ('C', 'U') THEN upper(btrim(h.final_action_date))
+        WHEN p.fad IS NOT NULL THEN 'D'
+    END,
+    fad_pd = CASE
+        WHEN upper(btrim(h.final_action_date)) = 'C' THEN h.bulletin_month + 14
+        ELSE p.fad
+    END,
+    fad_days = CASE
+        WHEN upper(btrim(h.final_action_date)) = 'C' THEN 0
+        ELSE p.fad - (h.bulletin_month + 14)
+    END,
+    filing_status = CASE
+        WHEN upper(btrim(h.filing_date)) IN ('C', 'U') THEN upper(btrim(h.filing_date))
+        WHEN p.filing IS NOT NULL THEN 'D'
+    END,
+    filing_pd = CASE
+        WHEN upper(btrim(h.filing_date)) = 'C' THEN h.bulletin_month + 14
+        ELSE p.filing
+    END,
+    filing_days = CASE
+        WHEN upper(btrim(h.filing_date)) = 'C' THEN 0
+        ELSE p.filing - (h.bulletin_month + 14)
+    END
+FROM (
+    SELECT bulletin_month, category, country,
+           pg_temp.parse_priority_date(final_action_date) AS fad,
+           pg_temp.parse_priority_date(filing_date) AS filing
+    FROM bulletin_history
+) AS p
+WHERE p.bulletin_month = h.bulletin_month
+  AND p.category = h.category
+  AND p.country = h.country;
@@ -0,0 +1,11 @@
+-- Rendered /history data for every category/country in one row, rebuilt
+-- whenever bulletin_history is written (api/utils/history_cache.py).
+-- version increments on each rebuild so instances can tell when their
+-- in-memory copy is stale without re-reading the payload.
+
+CREATE TABLE IF NOT EXISTS history_payloads (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL,
+    payloads JSONB NOT NULL,
+    built_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,4 @@
+-- Columnar history for every category/country, served by /api/history and
+-- rebuilt together with the rendered payloads.
+
+ALTER TABLE history_payloads ADD COLUMN IF NOT EXISTS dataset JSONB;
@@ -0,0 +1,11 @@
+-- Recent-visitor dedup as Bloom filter bits per time bucket (bucket = unix
+-- time // VISITOR_BUCKET_SECONDS), merged from every instance's in-memory
+-- filters (api/utils/hits.py). Old buckets are removed by the scheduled
+-- sweep (/api/sweep_visitors), not per request. recent_visitors is no
+-- longer read or written and can be dropped once this is deployed.
+
+CREATE TABLE IF NOT EXISTS visitor_filters (
+    bucket BIGINT PRIMARY KEY,
+    bits BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
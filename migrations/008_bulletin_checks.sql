@@ -0,0 +1,18 @@
+-- State of the cron's cheap change detector (api/utils/detector.py): when
+-- the index page was last polled, its content hash and bulletin link as of
+-- then, when the full scrape last ran, and counters of what was skipped.
+
+CREATE TABLE IF NOT EXISTS bulletin_checks (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    link TEXT,
+    index_hash TEXT,
+    checked_at TIMESTAMPTZ,
+    full_at TIMESTAMPTZ,
+    polls BIGINT NOT NULL DEFAULT 0,
+    not_due BIGINT NOT NULL DEFAULT 0,
+    index_unchanged BIGINT NOT NULL DEFAULT 0,
+    link_unchanged BIGINT NOT NULL DEFAULT 0,
+    full_runs BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO bulletin_checks (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Content hash of the cached bulletin (link + parsed tables, see
+-- BulletinSnapshot.table_hash). A check whose tables hash the same writes
+-- nothing; the first check after this migration fills it in.
+ALTER TABLE bulletin_cache ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Every distinct version of a bulletin's tables: revision 1 when the month
+-- first appears, then one row per mid-month correction.
+CREATE TABLE IF NOT EXISTS bulletin_revisions (
+    bulletin_month TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    source_url TEXT,
+    grids JSONB NOT NULL,
+    detected_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (bulletin_month, revision)
+);
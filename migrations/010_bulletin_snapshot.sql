@@ -0,0 +1,6 @@
+-- The cached bulletin as data instead of HTML: {link, bulletin_month, tables},
+-- the display text of each table cell (BulletinSnapshot.stored()). The page
+-- and email HTML are rendered from it per instance. The old pre-rendered
+-- result column is cleared by the next save and is no longer read; drop it
+-- once no older deployment is running.
+ALTER TABLE bulletin_cache ADD COLUMN IF NOT EXISTS snapshot JSONB;
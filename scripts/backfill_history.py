@@ -4,25 +4,58 @@ One-time backfill script to scrape all historical EB-2 'All Other' priority date
 from the U.S. State Department Visa Bulletin archives.
 
 Usage:
-    DATABASE_URL="postgres://..." python scripts/backfill_history.py
+    DATABASE_URL="postgres://..." python scripts/backfill_history.py [--workers 4] [--rate 2]
+    DATABASE_URL="postgres://..." python scripts/backfill_history.py --reprocess
 
 Requires the bulletin_history table to exist (see Step 1 in the plan).
-Rate-limited to 1 request/sec. Idempotent (ON CONFLICT DO NOTHING).
+Pages are fetched by a small worker pool behind a shared token-bucket rate
+limit and retried with backoff. Every raw page is kept in a gzip'd,
+content-addressed archive (--archive-dir) with a manifest.json mapping URLs
+to hashes, so re-runs never refetch settled pages. --reprocess rebuilds
+history from the archive alone, with no network.
+
+Fetching, parsing and DB writes run as a pipeline: a thread pool fetches,
+a process pool parses, and the main thread writes in batches, joined by
+bounded queues so each stage runs at full speed without unbounded memory.
+A pages/sec report per stage is printed at the end. Idempotent (upserts).
 """
 
+import argparse
+import gzip
+import hashlib
+import json
 import os
+import queue
 import sys
+import threading
 import time
 import requests
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 import psycopg2
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from api.utils.bulletin import snapshot_from_html
+from api.utils.db import history_rows, upsert_history_rows
+from api.utils.history_cache import rebuild_history_payloads
+from api.utils.ratelimit import TokenBucket
+
 BASE_URL = "https://travel.state.gov"
 INDEX_URL = f"{BASE_URL}/content/travel/en/legal/visa-law0/visa-bulletin.html"
 DB_URL = os.getenv("DATABASE_URL")
 
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "..", ".bulletin_archive")
+# Bulletins buffered before one batched upsert + commit
+WRITE_BATCH = 50
+# Items buffered between pipeline stages
+QUEUE_SIZE = 32
+RETRIES = 4
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 MONTH_NAMES = [
     "january", "february", "march", "april", "may", "june",
     "july", "august", "september", "october", "november", "december",
@@ -33,74 +66,111 @@ def get_db_connection():
     return psycopg2.connect(DB_URL)
 
 
-COUNTRY_COLUMNS = {
-    'all_other': 1,
-    'china': 2,
-    'india': 3,
-    'mexico': 4,
-    'philippines': 5,
-}
-
-CATEGORIES = ['1st', '2nd', '3rd']
+class Archive:
+    """Content-addressed store of raw pages: objects/ab/<sha256>.html.gz plus
+    manifest.json mapping each URL to its hash and fetch time."""
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest + ".html.gz")
+
+    def read(self, url):
+        """Archived body for `url`, or None."""
+        entry = self.manifest.get(url)
+        if not entry:
+            return None
+        path = self._object_path(entry["sha256"])
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rb") as f:
+            return f.read()
+
+    def object_path(self, url):
+        return self._object_path(self.manifest[url]["sha256"])
+
+    def write(self, url, content):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        with self.lock:
+            self.manifest[url] = {
+                "sha256": digest,
+                "size": len(content),
+                "fetched_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+
+    def save(self):
+        with self.lock:
+            tmp = self.manifest_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.manifest_path)
+
+
+class Fetcher:
+    """Rate-limited, retrying page fetcher backed by the raw-page archive."""
+
+    def __init__(self, rate, archive):
+        self.bucket = TokenBucket(rate)
+        self.archive = archive
+        self.session = requests.Session()
+        self.network_fetches = 0
+        self.cache_hits = 0
+
+    def get(self, url, use_cache=True):
+        """Return the page body. Raises after RETRIES failed attempts."""
+        if use_cache:
+            content = self.archive.read(url)
+            if content is not None:
+                self.cache_hits += 1
+                return content
+
+        for attempt in range(RETRIES):
+            self.bucket.acquire()
+            try:
+                resp = self.session.get(url, timeout=30)
+                if resp.status_code not in RETRY_STATUSES:
+                    resp.raise_for_status()
+                    break
+                error = RuntimeError(f"HTTP {resp.status_code}")
+            except requests.HTTPError:
+                raise
+            except requests.RequestException as e:
+                error = e
+            if attempt == RETRIES - 1:
+                raise error
+            time.sleep(2 ** attempt)
 
-def extract_eb2_all_categories(soup):
-    """Extract employment data for all categories and countries."""
-    tables = []
-    for bold in soup.find_all("b"):
-        text = bold.get_text()
-        if "Employment-" in text or "Employment" in text:
-            table = bold.find_parent("table")
-            if table and table not in tables:
-                tables.append(table)
+        self.network_fetches += 1
+        self.archive.write(url, resp.content)
+        return resp.content
 
-    if not tables:
-        return None
 
-    def _get_all_values(table):
-        results = {}
-        for row in table.select("tr"):
-            cells = row.find_all(["th", "td"])
-            if not cells:
-                continue
-            first_cell = cells[0].get_text(strip=True).replace('\xa0', ' ')
-            cat = None
-            for c in CATEGORIES:
-                if c in first_cell:
-                    cat = c
-                    break
-            if not cat:
-                continue
-            results[cat] = {}
-            for country, idx in COUNTRY_COLUMNS.items():
-                if idx < len(cells):
-                    results[cat][country] = cells[idx].get_text(strip=True).replace('\xa0', ' ')
-        return results
-
-    fad_data = _get_all_values(tables[0])
-    filing_data = _get_all_values(tables[1]) if len(tables) > 1 else {}
-
-    records = []
-    for cat in CATEGORIES:
-        for country in COUNTRY_COLUMNS:
-            fad = fad_data.get(cat, {}).get(country)
-            filing = filing_data.get(cat, {}).get(country)
-            if fad is not None:
-                records.append({'category': cat, 'country': country, 'fad': fad, 'filing': filing})
-    return records if records else None
-
-
-def find_all_bulletin_links():
+def find_all_bulletin_links(fetcher, pool):
     """Crawl the State Dept archive to find all individual bulletin page links."""
-    bulletin_links = []
-    visited_years = set()
+    bulletin_links = {}  # ordered set: url -> None
+    year_urls = {}
 
     print("Fetching main index page...")
-    resp = requests.get(INDEX_URL, timeout=30)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.content, "html.parser")
+    # The index changes monthly; always fetch it fresh
+    soup = BeautifulSoup(fetcher.get(INDEX_URL, use_cache=False), "html.parser")
 
     # Collect year page URLs from the main index
-    year_urls = []
     for a in soup.find_all("a", href=True):
         href = a["href"]
         if "/visa-bulletin/" not in href:
@@ -109,36 +179,36 @@ def find_all_bulletin_links():
         filename = href.rstrip("/").split("/")[-1].replace(".html", "")
 
         # Year archive page (e.g., /visa-bulletin/2024.html)
-        if filename.isdigit() and len(filename) == 4 and filename not in visited_years:
-            visited_years.add(filename)
-            year_urls.append(full_url)
+        if filename.isdigit() and len(filename) == 4:
+            year_urls.setdefault(filename, full_url)
         # Direct bulletin link on index page
         elif "visa-bulletin-for-" in filename.lower():
-            if full_url not in bulletin_links:
-                bulletin_links.append(full_url)
+            bulletin_links.setdefault(full_url)
 
     print(f"Found {len(year_urls)} year archive pages")
 
+    def crawl_year(year, year_url):
+        # Current/upcoming fiscal years still gain links; don't trust their cache
+        settled = int(year) < datetime.utcnow().year
+        return fetcher.get(year_url, use_cache=settled)
+
     # Crawl each year page for bulletin links
-    for year_url in sorted(year_urls):
-        time.sleep(1)
+    years = sorted(year_urls.items(), key=lambda item: item[1])
+    futures = [pool.submit(crawl_year, year, url) for year, url in years]
+    for (_, year_url), future in zip(years, futures):
         print(f"  Crawling {year_url}...")
         try:
-            resp = requests.get(year_url, timeout=30)
-            if not resp.ok:
-                print(f"    WARN: HTTP {resp.status_code}")
-                continue
-            year_soup = BeautifulSoup(resp.content, "html.parser")
-            for a in year_soup.find_all("a", href=True):
-                href = a["href"]
-                if "visa-bulletin-for-" in href.lower():
-                    full_url = urljoin(BASE_URL, href)
-                    if full_url not in bulletin_links:
-                        bulletin_links.append(full_url)
+            content = future.result()
         except Exception as e:
             print(f"    ERROR: {e}")
+            continue
+        year_soup = BeautifulSoup(content, "html.parser")
+        for a in year_soup.find_all("a", href=True):
+            href = a["href"]
+            if "visa-bulletin-for-" in href.lower():
+                bulletin_links.setdefault(urljoin(BASE_URL, href))
 
-    return bulletin_links
+    return list(bulletin_links)
 
 
 def parse_month_from_url(url):
@@ -170,62 +240,257 @@ def parse_month_from_url(url):
     return None
 
 
+def extract_records(url, month, content):
+    """History records for one bulletin page, or None if it has no tables."""
+    # Older bulletins spell the heading "Employment" without the hyphen
+    try:
+        snapshot = snapshot_from_html(content, url, month.strftime("%Y-%B"), marker="Employment")
+    except ValueError:
+        return None
+    return snapshot.records
+
+
+def _parse_one(url, month, content):
+    """Process-pool worker: parse one page and report how long it took."""
+    started = time.perf_counter()
+    records = extract_records(url, month, content)
+    return records, time.perf_counter() - started
+
+
+class StageStats:
+    """Throughput of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+        self.lock = threading.Lock()
+
+    def record(self, elapsed, items=1):
+        finished = time.monotonic()
+        with self.lock:
+            self.items += items
+            self.busy += elapsed
+            started = finished - elapsed
+            self.first = started if self.first is None else min(self.first, started)
+            self.last = finished if self.last is None else max(self.last, finished)
+
+    def report(self):
+        wall = (self.last - self.first) if self.items else 0.0
+        rate = self.items / wall if wall else 0.0
+        return (f"  {self.name:<6} {self.items:5d} pages   {rate:8.1f} pages/s   "
+                f"busy {self.busy:6.1f}s over {wall:6.1f}s")
+
+
+_DONE = object()
+
+
+def run_pipeline(jobs, fetch, args, stats):
+    """Fetch -> parse -> write pipeline over (url, month) jobs.
+
+    Yields (url, month, records) to the caller, which is the write stage;
+    records is None for pages without tables and an Exception on failure.
+    When the caller stops early (the write stage raised), the other stages
+    stop too and queued work is cancelled, so the error is reported instead
+    of the process hanging on a full queue."""
+    fetched = queue.Queue(maxsize=args.queue_size)
+    parsed = queue.Queue(maxsize=args.queue_size)
+    stop = threading.Event()
+    pools = []
+
+    def put(q, item):
+        # Blocks while the next stage falls behind, unless the pipeline stops
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def acquire(semaphore):
+        while not stop.is_set():
+            if semaphore.acquire(timeout=0.1):
+                return True
+        return False
+
+    def fetch_one(url, month):
+        if stop.is_set():
+            return
+        started = time.perf_counter()
+        try:
+            content = fetch(url)
+        except Exception as e:
+            content = e
+        stats["fetch"].record(time.perf_counter() - started)
+        put(fetched, (url, month, content))
+
+    def fetch_stage():
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            pools.append(pool)
+            for url, month in jobs:
+                if stop.is_set():
+                    break
+                try:
+                    pool.submit(fetch_one, url, month)
+                except RuntimeError:  # shut down by the stopping write stage
+                    break
+        put(fetched, _DONE)
+
+    def parse_stage():
+        in_flight = threading.BoundedSemaphore(args.queue_size)
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            pools.append(pool)
+            while (item := get(fetched)) is not _DONE:
+                url, month, content = item
+                if isinstance(content, Exception):
+                    put(parsed, item)
+                    continue
+                if not acquire(in_flight):
+                    break
+                try:
+                    future = pool.submit(_parse_one, url, month, content)
+                except RuntimeError:
+                    break
+
+                def done(f, url=url, month=month):
+                    try:
+                        records, elapsed = f.result()
+                        stats["parse"].record(elapsed)
+                    except Exception as e:  # including cancellation
+                        records = e
+                    put(parsed, (url, month, records))
+                    in_flight.release()
+
+                future.add_done_callback(done)
+        put(parsed, _DONE)
+
+    threads = [threading.Thread(target=fetch_stage, daemon=True),
+               threading.Thread(target=parse_stage, daemon=True)]
+    for t in threads:
+        t.start()
+    try:
+        while (item := parsed.get()) is not _DONE:
+            yield item
+    finally:
+        stop.set()
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+    for t in threads:
+        t.join()
+
+
+def bulletin_jobs(args, archive):
+    """(url, month) pairs to process and the function that fetches each page."""
+    if args.reprocess:
+        jobs = []
+        for url in sorted(archive.manifest):
+            month = parse_month_from_url(url) if "visa-bulletin-for-" in url.lower() else None
+            if month:
+                jobs.append((url, month))
+        print(f"Reprocessing {len(jobs)} archived bulletins\n")
+        return jobs, archive.read, None
+
+    fetcher = Fetcher(args.rate, archive)
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        links = find_all_bulletin_links(fetcher, pool)
+    print(f"\nFound {len(links)} total bulletin links\n")
+
+    jobs = []
+    for url in sorted(links):
+        month = parse_month_from_url(url)
+        if not month:
+            print(f"  SKIP (can't parse month): {url}")
+            continue
+        jobs.append((url, month))
+    return jobs, fetcher.get, fetcher
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Backfill bulletin_history from the archive")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent fetches")
+    parser.add_argument("--rate", type=float, default=2.0, help="max requests/sec")
+    parser.add_argument("--archive-dir", default=DEFAULT_ARCHIVE_DIR, help="raw-page archive location")
+    parser.add_argument("--reprocess", action="store_true", help="rebuild from the archive without network")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="parser processes")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="items buffered between stages")
+    args = parser.parse_args()
+
     if not DB_URL:
         print("ERROR: Set DATABASE_URL environment variable")
         sys.exit(1)
 
     print("=== Visa Bulletin EB-2 History Backfill ===\n")
 
-    links = find_all_bulletin_links()
-    print(f"\nFound {len(links)} total bulletin links\n")
+    archive = Archive(args.archive_dir)
+    jobs, fetch, fetcher = bulletin_jobs(args, archive)
+    stats = {name: StageStats(name) for name in ("fetch", "parse", "write")}
 
     conn = get_db_connection()
     inserted = 0
     skipped = 0
     errors = 0
-
-    for url in sorted(links):
-        month = parse_month_from_url(url)
-        if not month:
-            print(f"  SKIP (can't parse month): {url}")
-            skipped += 1
-            continue
-
-        time.sleep(1)  # Rate limiting
-        try:
-            resp = requests.get(url, timeout=30)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.content, "html.parser")
-            records = extract_eb2_all_categories(soup)
-
-            if records is None:
-                print(f"  SKIP (no EB-2 data): {month} — {url}")
-                skipped += 1
-                continue
-
-            for r in records:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        INSERT INTO bulletin_history (bulletin_month, category, country, final_action_date, filing_date, source_url)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (bulletin_month, category, country) DO UPDATE SET
-                            final_action_date = EXCLUDED.final_action_date,
-                            filing_date = EXCLUDED.filing_date,
-                            source_url = EXCLUDED.source_url
-                        """,
-                        (month, r['category'], r['country'], r.get('fad'), r.get('filing'), url),
-                    )
-            conn.commit()
-            inserted += 1
-            print(f"  OK: {month} — {len(records)} records")
-        except Exception as e:
-            errors += 1
-            print(f"  ERROR: {month} — {e}")
-
-    conn.close()
-    print(f"\nDone: {inserted} inserted, {skipped} skipped, {errors} errors")
+    started = time.monotonic()
+
+    pending = []
+    pending_bulletins = 0
+
+    def flush():
+        nonlocal pending, pending_bulletins
+        if not pending:
+            return
+        write_started = time.perf_counter()
+        with conn.cursor() as cur:
+            changed = upsert_history_rows(cur, pending)
+        conn.commit()
+        stats["write"].record(time.perf_counter() - write_started, items=pending_bulletins)
+        print(f"  Wrote {pending_bulletins} bulletins ({len(pending)} rows, {changed} changed)")
+        pending = []
+        pending_bulletins = 0
+
+    try:
+        with closing(run_pipeline(jobs, fetch, args, stats)) as results:
+            for url, month, records in results:
+                if isinstance(records, Exception):
+                    errors += 1
+                    print(f"  ERROR: {month} — {records}")
+                    continue
+                if records is None:
+                    print(f"  SKIP (no EB-2 data): {month} — {url}")
+                    skipped += 1
+                    continue
+
+                pending.extend(history_rows(month, records, url))
+                pending_bulletins += 1
+                inserted += 1
+                print(f"  OK: {month} — {len(records)} records")
+                if pending_bulletins >= WRITE_BATCH:
+                    flush()
+            flush()
+    finally:
+        conn.close()
+        archive.save()
+
+    print(f"\nDone: {inserted} inserted, {skipped} skipped, {errors} errors "
+          f"in {time.monotonic() - started:.1f}s")
+    if fetcher:
+        print(f"Fetches: {fetcher.network_fetches} from network, {fetcher.cache_hits} from archive")
+    print("Throughput:")
+    for stage in stats.values():
+        print(stage.report())
+
+    if inserted:
+        version = rebuild_history_payloads()
+        print(f"History payloads: {'rebuilt as version ' + str(version) if version else 'not rebuilt'}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Side-by-side latency and throughput of the Flask app (api/index.py) and its
+ASGI variant (api/asgi.py). Both are served by hypercorn, the Flask app
+through its WSGI thread pool, and driven by the same closed-loop load
+generator: --concurrency clients issuing requests back to back for
+--duration seconds per path.
+
+--db-latency puts a local TCP proxy in front of Postgres that delays each
+packet by half the given round trip, to mimic a managed database a few
+milliseconds away. --uncached zeroes the in-process cache TTLs so every
+request goes to Postgres, which is where concurrent queries pay off.
+
+Usage:
+    pip install -r requirements-async.txt
+    DATABASE_URL="postgres://localhost/visa_scratch" python scripts/bench_asgi.py [--uncached] [--db-latency 5]
+
+POSTs to /api/stats count visits: point it at a scratch database.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+APPS = [("flask", "wsgi:api.index:app"), ("asgi", "asgi:api.asgi:app")]
+PATHS = [
+    ("GET", "/"),
+    ("GET", "/?category=3rd&country=india"),
+    ("POST", "/api/stats"),
+    ("GET", "/history"),
+    ("GET", "/api/history"),
+]
+UNCACHED_ENV = {
+    "BULLETIN_CACHE_TTL": "0",
+    "SUBSCRIBER_COUNT_TTL": "0",
+    "HISTORY_CACHE_TTL": "0",
+    "HIT_FLUSH_INTERVAL": "0",
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LatencyProxy:
+    """TCP proxy to Postgres adding `delay` seconds each way, in its own
+    thread and event loop so it does not compete with the load generator."""
+
+    def __init__(self, database_url, round_trip_ms):
+        self.delay = round_trip_ms / 2000
+        parts = urlsplit(database_url)
+        query = parse_qs(parts.query)
+        host = query.pop("host", [parts.hostname or "localhost"])[0]
+        port = int(query.pop("port", [parts.port or 5432])[0])
+        self.upstream = (host, port)
+        self.port = free_port()
+        userinfo = parts.netloc.rsplit("@", 1)[0] + "@" if "@" in parts.netloc else ""
+        self.url = urlunsplit((parts.scheme, f"{userinfo}127.0.0.1:{self.port}", parts.path,
+                               urlencode(query, doseq=True), ""))
+        ready = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self._serve(ready)), daemon=True).start()
+        ready.wait()
+
+    async def _open_upstream(self):
+        host, port = self.upstream
+        if host.startswith("/"):
+            return await asyncio.open_unix_connection(f"{host}/.s.PGSQL.{port}")
+        return await asyncio.open_connection(host, port)
+
+    async def _pipe(self, reader, writer):
+        # Each chunk is released `delay` after it arrived, keeping order
+        # without serializing the delays
+        queue = asyncio.Queue()
+
+        async def release():
+            while (item := await queue.get()) is not None:
+                due, data = item
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        releaser = asyncio.create_task(release())
+        try:
+            while data := await reader.read(65536):
+                queue.put_nowait((time.monotonic() + self.delay, data))
+        finally:
+            queue.put_nowait(None)
+            await releaser
+
+    async def _handle(self, client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await self._open_upstream()
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(client_reader, upstream_writer),
+            self._pipe(upstream_reader, client_writer),
+            return_exceptions=True,
+        )
+
+    async def _serve(self, ready):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def start_server(app, port, env):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "hypercorn", "--bind", f"127.0.0.1:{port}", "--workers", "1", app],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{app} exited: {proc.stderr.read().decode()[-2000:]}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=5)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{app} did not start")
+
+
+async def load(base_url, method, path, concurrency, duration):
+    """Closed loop: each client sends its next request as soon as the last
+    one returns. Returns (latencies, errors, elapsed)."""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal errors
+            rng = random.Random()
+            while time.monotonic() < deadline:
+                headers = {"User-Agent": "Mozilla/5.0 (bench)", "Accept-Encoding": "gzip"}
+                if method == "POST":
+                    # A new visitor each time, so every POST is counted
+                    headers["X-Forwarded-For"] = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+                start = time.perf_counter()
+                try:
+                    resp = await client.request(method, path, headers=headers)
+                    if resp.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.monotonic() - start
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per app and path")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="added Postgres round trip, ms")
+    parser.add_argument("--uncached", action="store_true", help="zero the in-process cache TTLs")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("ERROR: Set DATABASE_URL environment variable")
+        sys.exit(1)
+
+    env = dict(os.environ)
+    if args.db_latency:
+        env["DATABASE_URL"] = LatencyProxy(database_url, args.db_latency).url
+    if args.uncached:
+        env.update(UNCACHED_ENV)
+
+    print(f"=== Flask vs ASGI: {args.concurrency} clients, {args.duration:g}s per path, "
+          f"{'uncached' if args.uncached else 'cached'}, +{args.db_latency:g} ms DB round trip ===\n")
+    print(f"{'app':<6} {'request':<34} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, app in APPS:
+        port = free_port()
+        proc = start_server(app, port, env)
+        try:
+            for method, path in PATHS:
+                latencies, errors, elapsed = asyncio.run(
+                    load(f"http://127.0.0.1:{port}", method, path, args.concurrency, args.duration)
+                )
+                latencies.sort()
+                print(f"{name:<6} {method + ' ' + path:<34} {len(latencies) / elapsed:8.0f} "
+                      f"{percentile(latencies, 0.50):8.1f} {percentile(latencies, 0.95):8.1f} "
+                      f"{percentile(latencies, 0.99):8.1f} {errors:7d}")
+        finally:
+            proc.terminate()
+            proc.wait()
+        print()
+
+
+if __name__ == "__main__":
+    main()
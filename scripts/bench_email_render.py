@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: rendering the new-bulletin email for many recipients,
+per-recipient rendering (the previous send_email path) versus EmailTemplate.
+
+Usage:
+    python scripts/bench_email_render.py [recipients]
+
+No network or database needed.
+"""
+
+import os
+import re
+import sys
+import time
+import tracemalloc
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from api.utils.email import SMTP_USER, EmailTemplate, _wrap_email_html
+
+# A body shaped like bulletin.email_fragment(): two styled tables
+ROW = "<tr>" + "".join(
+    '<td style="padding:10px 14px; border-bottom:1px solid #e2e8f0;">01JAN22</td>' for _ in range(6)
+) + "</tr>"
+TABLE = '<table width="100%">' + ROW * 12 + "</table>"
+BODY = (
+    '<h2>📢 Visa Bulletin for October 2026</h2>'
+    + '<h3>📄 Final Action Dates</h3>' + TABLE
+    + '<h3>📄 Dates for Filing</h3>' + TABLE
+)
+SUBJECT = "Visa Bulletin for 2026-October"
+MONTH = "2026-October"
+
+
+def legacy_render(to_email):
+    unsubscribe_url = f"https://visa-bulletin-checker.vercel.app/unsubscribe?email={quote(to_email)}"
+    body = re.split(r'<div id="last-updated-wrap"', BODY)[0]
+    body = body.split("⌛ Last updated time:")[0]
+    html = _wrap_email_html(body, MONTH, unsubscribe_url)
+    msg = MIMEMultipart()
+    msg["From"] = SMTP_USER
+    msg["To"] = to_email
+    msg["Subject"] = SUBJECT
+    msg.attach(MIMEText(html, "html"))
+    return msg.as_string()
+
+
+def legacy_loop(recipients):
+    for email in recipients:
+        legacy_render(email)
+
+
+def template_loop(recipients):
+    template = EmailTemplate(SUBJECT, BODY, MONTH)
+    for email in recipients:
+        template.render(email)
+
+
+def bench(fn, recipients):
+    start = time.perf_counter()
+    fn(recipients)
+    elapsed = time.perf_counter() - start
+    # Allocation is measured on a separate pass; tracing skews timings
+    tracemalloc.start()
+    fn(recipients[:1000])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    recipients = [f"user{i}@example.com" for i in range(n)]
+    print(f"=== Email rendering for {n:,} recipients ===\n")
+    base = None
+    for label, fn in (("per-recipient", legacy_loop), ("template", template_loop)):
+        elapsed, peak = bench(fn, recipients)
+        base = base or elapsed
+        print(f"{label:<14} {elapsed:7.3f} s   {elapsed / n * 1e6:7.1f} µs/msg   "
+              f"peak {peak / 1024:7.1f} KiB   {base / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark a full-archive reload of bulletin_history: one INSERT per row
+(the old path), one batched upsert per bulletin, and one batched upsert for
+the whole archive.
+
+Usage:
+    DATABASE_URL="postgres://localhost/visa" python scripts/bench_history_writes.py [bulletins]
+
+Writes go to a session-local temp table that shadows bulletin_history, so
+real data is never touched.
+"""
+
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import psycopg2
+
+from api.utils.bulletin import CATEGORIES, COUNTRY_COLUMNS
+from api.utils.db import HISTORY_UPSERT_SQL, history_rows, upsert_history_rows
+
+ROW_SQL = HISTORY_UPSERT_SQL.replace("VALUES %s", "VALUES (" + ", ".join(["%s"] * 12) + ")")
+
+
+def synthetic_archive(n):
+    archive = []
+    for i in range(n):
+        month = date(2000 + i // 12, i % 12 + 1, 1)
+        records = [
+            {'category': cat, 'country': country, 'fad': f"01JAN{i % 100:02d}", 'filing': 'C'}
+            for cat in CATEGORIES for country in COUNTRY_COLUMNS
+        ]
+        archive.append((month, records, f"https://example.com/{i}.html"))
+    return archive
+
+
+def per_row(cur, archive):
+    trips = 0
+    for month, records, url in archive:
+        for row in history_rows(month, records, url):
+            cur.execute(ROW_SQL, row)
+            trips += 1
+    return trips
+
+
+def per_bulletin(cur, archive):
+    for month, records, url in archive:
+        upsert_history_rows(cur, history_rows(month, records, url))
+    return len(archive)
+
+
+def whole_archive(cur, archive):
+    rows = [row for month, records, url in archive for row in history_rows(month, records, url)]
+    upsert_history_rows(cur, rows)
+    return 1
+
+
+def main():
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: Set DATABASE_URL environment variable")
+        sys.exit(1)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    archive = synthetic_archive(n)
+    rows = sum(len(records) for _, records, _ in archive)
+
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    with conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE bulletin_history (LIKE public.bulletin_history INCLUDING ALL)")
+    conn.commit()
+
+    print(f"=== Full-archive reload: {n} bulletins, {rows} rows ===\n")
+    for label, fn in (("per row", per_row), ("per bulletin", per_bulletin), ("whole archive", whole_archive)):
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE bulletin_history")
+        conn.commit()
+        # Second pass exercises the ON CONFLICT update path
+        for phase in ("insert", "update"):
+            start = time.perf_counter()
+            with conn.cursor() as cur:
+                trips = fn(cur, archive)
+            conn.commit()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<14} {phase:<7} {trips:6d} round trips   {elapsed * 1000:9.1f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark the "/" page data loading: a cold instance (one statement reads
+bulletin_cache and bulletin_history), a warm one whose bulletin copy is past
+BULLETIN_CACHE_TTL (the same statement, without the snapshot), and a warm
+one serving both from memory.
+
+Usage:
+    DATABASE_URL="postgres://localhost/visa" python scripts/bench_index_loader.py [iterations]
+
+Read-only.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from api.utils import db, page
+from api.utils.db import bulletin_cache_stats, pool_stats
+from api.utils.page import load_index_page
+
+
+def cold_path():
+    db._bulletin_memo["entry"] = None
+    page._latest.clear()
+    load_index_page(category='2nd', country='all_other')
+
+
+def stale_path():
+    db._bulletin_memo["expires"] = 0.0
+    load_index_page(category='2nd', country='all_other')
+
+
+def warm_path():
+    load_index_page(category='2nd', country='all_other')
+
+
+def bench(label, fn, iterations):
+    fn()  # warm the pool (and the cache, for the warm path)
+    before = pool_stats()["checkouts"]
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    checkouts = (pool_stats()["checkouts"] - before) / iterations
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1000
+    p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+    print(f"{label:<6} p50 {p50:7.3f} ms   p95 {p95:7.3f} ms   round trips/page {checkouts:.0f}")
+
+
+def main():
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: Set DATABASE_URL environment variable")
+        sys.exit(1)
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"=== Index page loader ({iterations} iterations) ===\n")
+    bench("cold", cold_path, iterations)
+    bench("stale", stale_path, iterations)
+    bench("warm", warm_path, iterations)
+    print(f"\nbulletin cache: {bulletin_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
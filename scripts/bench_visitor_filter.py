@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark recent-visitor dedup: the in-memory Bloom filter used by
+api/utils/hits.py against a plain Python set, and (with DATABASE_URL set)
+the old per-visit recent_visitors queries.
+
+Usage:
+    python scripts/bench_visitor_filter.py [ips]
+    DATABASE_URL="postgres://localhost/visa_scratch" python scripts/bench_visitor_filter.py [ips]
+
+The database section writes to recent_visitors: use a scratch database.
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from api.utils.bloom import BloomFilter
+from api.utils.hits import VISITOR_FILTER_ERROR
+
+DB_SAMPLE = 500
+
+
+def random_ips(n, seed):
+    rng = random.Random(seed)
+    return [f"{rng.randrange(1, 255)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+            for _ in range(n)]
+
+
+def rate(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def bench_bloom(ips, unseen):
+    bloom = BloomFilter(len(ips), VISITOR_FILTER_ERROR)
+    adds = rate(bloom.add, ips)
+    lookups = rate(bloom.__contains__, ips)
+    false_positives = sum(ip in bloom for ip in unseen) / len(unseen)
+    per_million = len(bloom.bits) * 1_000_000 / len(ips)
+    print(f"bloom   add {adds:10,.0f}/s   lookup {lookups:10,.0f}/s   "
+          f"{per_million / 2**20:7.2f} MiB per 1M IPs   false positives {false_positives:.2%} "
+          f"(target {VISITOR_FILTER_ERROR:.0%}, k={bloom.hashes})")
+
+
+def bench_set(ips):
+    tracemalloc.start()
+    seen = set()
+    adds = rate(seen.add, ips)
+    # The set's table plus the IP strings it has to keep alive
+    size = tracemalloc.get_traced_memory()[0] + sum(sys.getsizeof(ip) for ip in ips)
+    tracemalloc.stop()
+    lookups = rate(seen.__contains__, ips)
+    per_million = size * 1_000_000 / len(ips)
+    print(f"set     add {adds:10,.0f}/s   lookup {lookups:10,.0f}/s   "
+          f"{per_million / 2**20:7.2f} MiB per 1M IPs   (exact)")
+
+
+def bench_db(ips):
+    import psycopg2
+
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+
+    def old_visit(ip):
+        # The previous is_recent_visitor() + record_visitor() statements
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM recent_visitors WHERE ip = %s AND visited_at > NOW() - INTERVAL '1 hour' LIMIT 1",
+                (ip,),
+            )
+            if cur.fetchone() is None:
+                cur.execute(
+                    "INSERT INTO recent_visitors (ip, visited_at) VALUES (%s, NOW()) "
+                    "ON CONFLICT (ip) DO UPDATE SET visited_at = NOW()",
+                    (ip,),
+                )
+                cur.execute("DELETE FROM recent_visitors WHERE visited_at < NOW() - INTERVAL '1 hour'")
+        conn.commit()
+
+    visits = rate(old_visit, ips[:DB_SAMPLE])
+    conn.close()
+    print(f"db      visit {visits:8,.0f}/s   (recent_visitors: SELECT + upsert + DELETE per visit, "
+          f"{DB_SAMPLE} visits)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    ips = random_ips(n, seed=1)
+    unseen = [f"unseen-{ip}" for ip in random_ips(min(n, 100_000), seed=2)]
+    print(f"=== Recent-visitor dedup: {n:,} IPs ===\n")
+    bench_bloom(ips, unseen)
+    bench_set(ips)
+    if os.getenv("DATABASE_URL"):
+        bench_db(ips)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Validate the streaming bulletin parser against the BeautifulSoup path and
+report parse time and peak memory for each.
+
+Usage:
+    python scripts/compare_parsers.py path/to/fixtures [more paths...]
+
+Fixtures are saved bulletin pages (*.html or *.html.gz). For every page the
+table grids, extracted records and formatted table HTML must match.
+"""
+
+import gzip
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from api.utils.bulletin import extract_bulletin_grids, format_grid_html, records_from_grids
+
+ENGINES = ("bs4", "stream")
+
+
+def load_fixtures(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.endswith((".html", ".html.gz")))
+        else:
+            files.append(path)
+    for name in sorted(files):
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(name, "rb") as f:
+            yield name, f.read()
+
+
+def run_engine(engine, content):
+    """Full extraction on one engine: grids, records and formatted tables."""
+    try:
+        grids = extract_bulletin_grids(content, engine=engine)
+    except ValueError:
+        return None
+    return grids, records_from_grids(grids), [format_grid_html(g) for g in grids]
+
+
+def measure(engine, content):
+    start = time.perf_counter()
+    result = run_engine(engine, content)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    run_engine(engine, content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(1)
+
+    totals = {e: {"time": 0.0, "peak": 0} for e in ENGINES}
+    pages = mismatches = 0
+    for name, content in load_fixtures(sys.argv[1:]):
+        pages += 1
+        results = {}
+        for engine in ENGINES:
+            result, elapsed, peak = measure(engine, content)
+            results[engine] = result
+            totals[engine]["time"] += elapsed
+            totals[engine]["peak"] = max(totals[engine]["peak"], peak)
+        if results["bs4"] != results["stream"]:
+            mismatches += 1
+            print(f"  MISMATCH: {name}")
+
+    if not pages:
+        print("No fixtures found")
+        sys.exit(1)
+
+    print(f"\n{pages} pages, {mismatches} mismatches\n")
+    base = totals["bs4"]["time"]
+    for engine in ENGINES:
+        t = totals[engine]
+        print(f"{engine:<7} {t['time'] * 1000 / pages:8.2f} ms/page   "
+              f"peak {t['peak'] / 1024 / 1024:7.2f} MiB   {base / t['time']:5.1f}x")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
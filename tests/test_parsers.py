@@ -0,0 +1,37 @@
+"""The streaming bulletin parser must match the BeautifulSoup path on saved
+bulletin pages (see also scripts/compare_parsers.py)."""
+
+from pathlib import Path
+
+import pytest
+
+from api.utils.bulletin import extract_bulletin_grids, format_grid_html, records_from_grids
+
+FIXTURES = Path(__file__).parent / "fixtures"
+WITH_TABLES = ["bulletin_closed_cells.html", "bulletin_implied_end_tags.html"]
+
+
+def extract(engine, content):
+    grids = extract_bulletin_grids(content, engine=engine)
+    return grids, records_from_grids(grids), [format_grid_html(g) for g in grids]
+
+
+@pytest.mark.parametrize("name", WITH_TABLES)
+def test_stream_matches_bs4(name):
+    content = (FIXTURES / name).read_bytes()
+    assert extract("stream", content) == extract("bs4", content)
+
+
+@pytest.mark.parametrize("engine", ["bs4", "stream"])
+def test_unclosed_cells_end_at_the_next_cell(engine):
+    content = (FIXTURES / "bulletin_implied_end_tags.html").read_bytes()
+    grids, records, _ = extract(engine, content)
+    assert [row[0][0] for row in grids[0]][:3] == ["Employment-based", "1st", "2nd"]
+    assert {"category": "2nd", "country": "all_other", "fad": "15JUL23", "filing": "15OCT23"} in records
+
+
+@pytest.mark.parametrize("engine", ["bs4", "stream"])
+def test_page_without_tables(engine):
+    content = (FIXTURES / "bulletin_without_tables.html").read_bytes()
+    with pytest.raises(ValueError):
+        extract_bulletin_grids(content, engine=engine)